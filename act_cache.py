@@ -0,0 +1,162 @@
+import hashlib
+import logging
+import os
+import pickle
+
+from openpyxl import load_workbook
+
+from act_manifest import GENERATOR_VERSION, file_hash
+from act_template import SheetLayout, compile_template
+from act_xml import XmlSheetTemplate, ZipFileTemplate
+
+
+def user_cache_folder():
+    '''Папка кеша пользователя.
+
+    В Windows — в %LOCALAPPDATA%, в остальных системах — в
+    $XDG_CACHE_HOME или ~/.cache. Кеш не лежит в текущей папке: туда
+    может писать кто угодно, а кеш читается как готовые данные.
+    '''
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = (os.environ.get('XDG_CACHE_HOME')
+                or os.path.expanduser('~/.cache'))
+    return os.path.join(base, 'aocp')
+
+
+# Папка кеша разобранных шаблонов и снимков книг данных
+CACHE_FOLDER = user_cache_folder()
+
+# Шаблоны, уже разобранные в этом процессе: путь кеша -> (хеш, шаблон).
+# Долгоживущий процесс (режим наблюдения) не читает кеш с диска повторно
+_loaded = {}
+
+# Классы, которые может содержать кеш: только данные разобранных
+# шаблонов. Любое другое имя при чтении кеша запрещено, поэтому
+# подложенный в папку кеша файл не выполнит свой код
+CACHE_CLASSES = {
+    'act_template': {'CellSlot', 'TemplatePlan', 'SheetLayout'},
+    'act_xml': {'XmlSheetTemplate', 'XmlRowSlot', 'XmlCellSlot',
+                'ZipFileTemplate'},
+    'act_zip': {'ZipMember'},
+    'datetime': {'date', 'datetime', 'time', 'timedelta'},
+}
+
+
+class CacheUnpickler(pickle.Unpickler):
+    '''Чтение кеша только с классами из CACHE_CLASSES.'''
+
+    def find_class(self, module, name):
+        if name not in CACHE_CLASSES.get(module, ()):
+            raise pickle.UnpicklingError(
+                f"в кеше недопустимый объект {module}.{name}")
+        return super().find_class(module, name)
+
+
+def cache_path(template_file, kind, cache_folder=CACHE_FOLDER):
+    '''Путь к файлу кеша: один файл на шаблон и вид представления.
+
+    Одноимённые шаблоны из разных папок получают разные файлы.
+    '''
+    name = os.path.splitext(os.path.basename(template_file))[0]
+    key = hashlib.sha256(
+        os.path.abspath(template_file).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(cache_folder, f'{name}.{key}.{kind}.pickle')
+
+
+def load_cached(template_file, kind, build, cache_folder=CACHE_FOLDER):
+    '''Возвращает разобранный шаблон из кеша на диске или build().
+
+    Запись кеша действительна, пока совпадают хеш содержимого шаблона
+    и версия генератора; иначе шаблон разбирается заново и запись
+    перезаписывается. Загруженный шаблон остаётся в памяти процесса до
+    изменения файла. При cache_folder=None кеш не используется.
+    '''
+    if cache_folder is None:
+        return build()
+
+    template_hash = file_hash(template_file)
+    path = cache_path(template_file, kind, cache_folder)
+    loaded = _loaded.get(path)
+    if loaded is not None and loaded[0] == template_hash:
+        return loaded[1]
+    try:
+        with open(path, 'rb') as f:
+            entry = CacheUnpickler(f).load()
+        if (entry['template_hash'] == template_hash
+                and entry['generator_version'] == GENERATOR_VERSION):
+            logging.info(f"Шаблон '{template_file}' загружен из кеша")
+            _loaded[path] = (template_hash, entry['value'])
+            return entry['value']
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logging.warning(f"Кеш шаблона '{path}' не прочитан: {e}")
+
+    value = build()
+    _loaded[path] = (template_hash, value)
+    entry = {
+        'template_hash': template_hash,
+        'generator_version': GENERATOR_VERSION,
+        'value': value,
+    }
+    os.makedirs(cache_folder, exist_ok=True)
+    # Имя временного файла уникально для процесса: кеш может заполняться
+    # одновременно рабочими процессами пула
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.warning(f"Кеш шаблона '{path}' не записан: {e}")
+    return value
+
+
+def load_template_workbook(template_file, cache_folder=CACHE_FOLDER):
+    '''Книга шаблона openpyxl со всеми листами, стилями и настройками.
+
+    Книга на диск не кешируется: это объекты openpyxl, а не данные.
+    Долгоживущий процесс держит её в памяти, пока файл не изменится;
+    разбор листа шаблона кешируется отдельно (load_template_plan).
+    '''
+    if cache_folder is None:
+        return load_workbook(template_file)
+    template_hash = file_hash(template_file)
+    key = ('openpyxl', os.path.abspath(template_file))
+    loaded = _loaded.get(key)
+    if loaded is not None and loaded[0] == template_hash:
+        return loaded[1]
+    wb = load_workbook(template_file)
+    _loaded[key] = (template_hash, wb)
+    return wb
+
+
+def load_template_plan(template_file, sheet_name, cache_folder=CACHE_FOLDER):
+    '''План заполнения и разметка клонирования листа шаблона openpyxl.
+
+    Хранятся отдельно от книги: вместо разбора листа на каждом запуске
+    читается небольшая запись кеша. Возвращает (TemplatePlan,
+    SheetLayout).
+    '''
+    def build():
+        ws = load_template_workbook(template_file, cache_folder)[sheet_name]
+        return compile_template(ws), SheetLayout(ws)
+
+    return load_cached(template_file, f'plan.{sheet_name}', build,
+                       cache_folder)
+
+
+def load_xml_template(template_file, sheet_name, cache_folder=CACHE_FOLDER):
+    '''Скомпилированный лист шаблона для движка xml.'''
+    return load_cached(template_file, f'xml.{sheet_name}',
+                       lambda: XmlSheetTemplate(template_file, sheet_name),
+                       cache_folder)
+
+
+def load_zip_template(template_file, sheet_name, cache_folder=CACHE_FOLDER):
+    '''Архив шаблона для записи файлов актов правкой zip.'''
+    return load_cached(template_file, f'zip.{sheet_name}',
+                       lambda: ZipFileTemplate(template_file, sheet_name),
+                       cache_folder)
@@ -0,0 +1,210 @@
+import logging
+from collections import namedtuple
+from datetime import date, datetime
+from functools import lru_cache
+
+from openpyxl import load_workbook
+
+
+# Поля записи акта и заголовки столбцов листа данных: (группа, подзаголовок).
+# Подзаголовок None — первый столбец группы.
+ACT_COLUMNS = (
+    ('id', ('№', None)),
+    ('act_number', ('№ акта', None)),
+    ('work_name', ('Наименование работ', None)),
+    ('start_date', ('Дата', 'Нач')),
+    ('end_date', ('Дата', 'Кон')),
+    ('concrete_type', ('Бетон', None)),
+    ('volume', ('Объем', None)),
+    ('mixture_number', ('Смесь', '№')),
+    ('mixture_volume', ('Смесь', 'Объем')),
+    ('mixture_date', ('Смесь', 'Дата')),
+    ('lab_uzk', ('Лаба', 'УЗК')),
+    ('lab_k', ('Лаба', 'К')),
+    ('lab_date', ('Лаба', 'Дата')),
+    ('code', ('Шифр', None)),
+    ('agreement_date', ('Согл', 'Дата')),
+)
+
+# Поля с датами: datetime из Excel приводится к date
+DATE_FIELDS = frozenset((
+    'start_date', 'end_date', 'mixture_date', 'lab_date', 'agreement_date'))
+
+HEADER_ROWS = 2
+
+ActRecord = namedtuple(
+    'ActRecord', ['row_number'] + [field for field, _ in ACT_COLUMNS])
+ActRecord.__doc__ = '''Строка листа данных с разобранными полями акта.'''
+
+
+# Различных дат в книге немного (месяц актов — около 30), поэтому
+# каждая форматируется один раз
+DATE_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def _date_text(val):
+    '''Дата в формате ДД.ММ.ГГГГ, с кешем по значению.'''
+    return val.strftime('%d.%m.%Y')
+
+
+def format_date(val):
+    '''Функция для формата ячеек с датами.'''
+    return _date_text(val) if isinstance(val, date) else str(val or '')
+
+
+def format_text(val):
+    '''Текст необязательной ячейки: пустая ячейка даёт пустую строку.'''
+    return str(val) if val else ''
+
+
+def get_act_date(*dates):
+    '''Упрощенная функция для определения даты акта.
+
+    Дата акта — самая поздняя из переданных дат; значения, не
+    являющиеся датами, пропускаются. Без дат — сегодняшняя дата.
+    '''
+    latest = None
+    for dt in dates:
+        if isinstance(dt, datetime):
+            dt = dt.date()
+        elif not isinstance(dt, date):
+            continue
+        if latest is None or dt > latest:
+            latest = dt
+    return _date_text(latest if latest is not None else date.today())
+
+
+def normalize_header(value):
+    '''Заголовок без переносов строк и лишних пробелов.'''
+    return ' '.join(str(value).split()) if value is not None else None
+
+
+def resolve_columns(header_rows, columns=ACT_COLUMNS):
+    '''Индексы столбцов полей по двум строкам заголовка.
+
+    Группа в первой строке заголовка распространяется вправо на пустые
+    ячейки (объединённые заголовки), подзаголовок берётся из второй.
+    Отсутствующие в заголовке поля получают индекс None.
+    '''
+    groups, subs = (list(row) for row in header_rows)
+    subs += [None] * (len(groups) - len(subs))
+    headers = []
+    group = None
+    for index, value in enumerate(groups):
+        if value is not None:
+            group = normalize_header(value)
+        headers.append((group, normalize_header(subs[index])))
+
+    indices = {}
+    for field, (group, sub) in columns:
+        indices[field] = None
+        for index, (column_group, column_sub) in enumerate(headers):
+            if column_group == group and (sub is None or column_sub == sub):
+                indices[field] = index
+                break
+    return indices
+
+
+def open_data_workbook(data_file):
+    '''Открывает книгу данных только для чтения со значениями формул.'''
+    return load_workbook(data_file, read_only=True, data_only=True)
+
+
+def iter_sheet_records(wb, sheet_name):
+    '''Потоково читает лист открытой книги данных, выдаёт ActRecord.
+
+    Столбцы определяются по заголовкам, а не по номерам. Полностью
+    пустые строки пропускаются.
+    '''
+    ws = wb[sheet_name]
+    rows = ws.iter_rows(values_only=True)
+    header = [next(rows, ()) for _ in range(HEADER_ROWS)]
+    indices = resolve_columns(header)
+
+    missing = [field for field, index in indices.items() if index is None]
+    if missing:
+        logging.warning(f"На листе '{sheet_name}' не найдены столбцы: "
+                        f"{', '.join(missing)}")
+
+    getters = []
+    for field, _ in ACT_COLUMNS:
+        getters.append((indices[field], field in DATE_FIELDS))
+
+    for row_number, row in enumerate(rows, start=HEADER_ROWS + 1):
+        if not any(value is not None for value in row):
+            continue
+        values = [row_number]
+        for index, is_date in getters:
+            value = (row[index] if index is not None and index < len(row)
+                     else None)
+            if is_date and isinstance(value, datetime):
+                value = value.date()
+            values.append(value)
+        yield ActRecord._make(values)
+
+
+def parse_rows(text):
+    '''Диапазоны строк листа данных: '5-20,31' -> ((5, 20), (31, 31)).'''
+    ranges = []
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        first, last = int(first), int(last or first)
+        if first > last:
+            raise ValueError(f"Неверный диапазон строк: {part}")
+        ranges.append((first, last))
+    if not ranges:
+        raise ValueError("Не указаны строки")
+    return tuple(ranges)
+
+
+def select_rows(records, ranges):
+    '''Записи только из строк листа, попадающих в диапазоны ranges.'''
+    for record in records:
+        if any(first <= record.row_number <= last
+               for first, last in ranges):
+            yield record
+
+
+def count_sheet_records(wb, sheet_name):
+    '''Оценка числа строк данных листа по его размерам (для прогресса).
+
+    Пустые строки в оценку входят; None, если размеры листа неизвестны.
+    '''
+    max_row = wb[sheet_name].max_row
+    return max(max_row - HEADER_ROWS, 0) if max_row else None
+
+
+class WorkbookData:
+    '''Книга данных openpyxl для чтения записей по листам.
+
+    Интерфейс тот же, что у снимка данных act_snapshot.DataSnapshot.
+    '''
+
+    def __init__(self, data_file):
+        self.wb = open_data_workbook(data_file)
+
+    @property
+    def sheetnames(self):
+        return self.wb.sheetnames
+
+    def count_records(self, sheet_name):
+        return count_sheet_records(self.wb, sheet_name)
+
+    def sheet_records(self, sheet_name):
+        return iter_sheet_records(self.wb, sheet_name)
+
+    def close(self):
+        self.wb.close()
+
+
+def read_act_records(data_file, sheet_name):
+    '''Потоково читает лист данных из файла и выдаёт записи ActRecord.'''
+    wb = open_data_workbook(data_file)
+    try:
+        yield from iter_sheet_records(wb, sheet_name)
+    finally:
+        wb.close()
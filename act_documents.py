@@ -0,0 +1,391 @@
+import logging
+import re
+from collections import namedtuple
+
+from datetime import date
+
+from act_data import format_date, format_text, get_act_date
+
+
+DocumentType = namedtuple('DocumentType', (
+    'key',              # Короткое имя для командной строки
+    'title',            # Вид работ для сообщений
+    'data_sheet',       # Лист книги данных
+    'template_file',    # Файл шаблона
+    'template_sheet',   # Лист шаблона с актом
+    'output_folder',    # Папка для актов
+    'output_file',      # Общий файл актов или None — файл на каждый акт
+    'build',            # Функция: запись -> значения плейсхолдеров
+    'check',            # Функция: запись -> предупреждения по данным
+    'hidden_rows',      # (строка, плейсхолдер): скрыть, если значение пусто
+))
+DocumentType.__doc__ = '''Описание вида документа для генерации актов.'''
+
+
+# Постоянные формулировки документов
+DKBS = ('документ о качестве бетонной смеси заданного '
+        'состава качества партии')
+NAME_UZK = ('Протокол оценки прочности бетона монолитных '
+            'железобетонных конструкций')
+NAME_K1 = ('Акт отбора проб бетонной смеси и изготовления '
+           'контрольных образцов')
+NAME_K2 = ('Протокол оценки прочности бетона монолитных '
+           'конструкций')
+NAME_GI1 = ('Протокол определения фактической влажности бетонного '
+            'основания при устройстве гидроизоляции')
+NAME_GI2 = 'Протокол определения адгезии гидроизоляционного покрытия'
+
+
+def common_replacements(record, act_date):
+    '''Плейсхолдеры, одинаковые для всех видов документов.'''
+    agreement_date = format_date(record.agreement_date)
+
+    # Проверка ЖАН
+    agreement = (f'Запись из ЖАН от {agreement_date}'
+                 if agreement_date else '')
+
+    return {
+        '[№ акта]': str(record.act_number),
+        '[Наименование работ]': str(record.work_name),
+        '[Дата начала работы]': format_date(record.start_date),
+        '[Дата окончания работы]': format_date(record.end_date),
+        '[Шифр]': str(record.code),
+        '[Согласование]': agreement,
+        '[Дата акта]': act_date,
+    }
+
+
+def common_warnings(record):
+    '''Предупреждения, общие для всех видов документов.'''
+    warnings = []
+    if not record.act_number:
+        warnings.append('не заполнен номер акта')
+    if not record.work_name:
+        warnings.append('не заполнено наименование работ')
+    if not record.code:
+        warnings.append('не заполнен шифр')
+    for field in ('start_date', 'end_date', 'lab_date', 'agreement_date'):
+        value = getattr(record, field)
+        if value and not isinstance(value, date):
+            warnings.append(f"значение '{value}' в поле {field} не "
+                            f"распознано как дата")
+    if not record.start_date or not record.end_date:
+        warnings.append('не заполнены даты начала и окончания работ')
+    if not any(isinstance(value, date) for value in (
+            record.end_date, record.lab_date, record.agreement_date)):
+        warnings.append('нет дат для даты акта, будет сегодняшняя дата')
+    return warnings
+
+
+def line_warnings(numbers, documents, name):
+    '''Проверка многострочных материалов: номера и документы построчно.'''
+    numbers = format_text(numbers).split('\n')
+    documents = format_date(documents).split('\n')
+    warnings = []
+    if len(numbers) > 1 and len(numbers) != len(documents):
+        warnings.append(f'{name}: строк в номерах ({len(numbers)}) и в '
+                        f'документах ({len(documents)}) не поровну')
+    if len(numbers) > 2:
+        warnings.append(f'{name}: в акт попадут только первые две строки '
+                        f'из {len(numbers)}')
+    return warnings
+
+
+def check_concrete(record):
+    '''Предупреждения по строке акта на бетонирование.'''
+    warnings = common_warnings(record)
+    if str(record.mixture_number) != 'Реестр':
+        warnings += line_warnings(record.mixture_number,
+                                  record.mixture_date, 'смесь')
+        if not record.mixture_number:
+            warnings.append('не заполнен номер смеси')
+    if not record.lab_uzk and not record.lab_k:
+        warnings.append('не указан протокол лаборатории (УЗК или К)')
+    return warnings
+
+
+def check_gi(record):
+    '''Предупреждения по строке акта на гидроизоляцию.'''
+    warnings = common_warnings(record)
+    warnings += line_warnings(record.mixture_number, record.mixture_volume,
+                              'материалы')
+    if not record.mixture_number:
+        warnings.append('не заполнены материалы')
+    return warnings
+
+
+def check_arm(record):
+    '''Предупреждения по строке акта на армирование.'''
+    return common_warnings(record)
+
+
+def build_concrete(record):
+    '''Значения плейсхолдеров акта на бетонирование.'''
+    act_number = str(record.act_number)
+    start_date = format_date(record.start_date)
+    concrete_type = str(record.concrete_type)
+    mixture_number = str(record.mixture_number)
+    mixture_date = format_date(record.mixture_date)
+    lab_uzk = format_text(record.lab_uzk)
+    lab_k = format_text(record.lab_k)
+    lab_date = format_date(record.lab_date)
+
+    # Упрощенная проверка даты акта
+    act_date = get_act_date(record.end_date, record.lab_date,
+                            record.agreement_date)
+
+    # Проверка материалов, реестр или нет
+    if mixture_number == 'Реестр':
+        material1 = (f'Материалы согласно реестру '
+                     f'№{act_number} от {act_date}')
+        material2 = f'Реестр №{act_number} от {act_date}'
+        material1_1, material2_1 = '', ''
+    elif '\n' in mixture_number:
+        mixture_number_parts = mixture_number.split('\n')
+        mixture_date_parts = mixture_date.split('\n')
+        material1 = (f'{concrete_type} - {DKBS} '
+                     f'№{mixture_number_parts[0]} '
+                     f'от {mixture_date_parts[0]}')
+        material1_1 = (f'{concrete_type} - {DKBS} '
+                       f'№{mixture_number_parts[1]} '
+                       f'от {mixture_date_parts[1]}')
+        material2 = (f'{DKBS.capitalize()} '
+                     f'№{mixture_number_parts[0]} '
+                     f'от {mixture_date_parts[0]}')
+        material2_1 = (f'{DKBS.capitalize()} '
+                       f'№{mixture_number_parts[1]} '
+                       f'от {mixture_date_parts[1]}')
+    else:
+        material1 = (f'{concrete_type} - {DKBS} '
+                     f'№{mixture_number} от {mixture_date}')
+        material2 = (f'{DKBS.capitalize()} '
+                     f'№{mixture_number} от {mixture_date}')
+        material1_1, material2_1 = '', ''
+
+    # Проверка лаборатории, УЗК или К
+    if lab_uzk:
+        lab1 = (f'{NAME_UZK} №{lab_uzk}-УЗК/2/1.3В-2025 '
+                f'от {lab_date}')
+        lab2 = ''
+    else:
+        lab1 = (f'{NAME_K1} №{lab_k}-К/2/1.3В-2025 '
+                f'от {start_date}')
+        lab2 = (f'{NAME_K2} №{lab_k}-К7/2/1.3В-2025 '
+                f'от {lab_date}')
+
+    replacements = common_replacements(record, act_date)
+    replacements.update({
+        '[Материалы1]': material1,
+        '[Материалы2]': material2,
+        '[Материалы1_1]': material1_1,
+        '[Материалы2_1]': material2_1,
+        '[Лаборатория1]': lab1,
+        '[Лаборатория2]': lab2,
+    })
+    return replacements
+
+
+def build_gi(record):
+    '''Значения плейсхолдеров акта на гидроизоляцию.
+
+    На листе ГИ столбец «Бетон» содержит следующую работу, а столбцы
+    «Смесь» — материалы и их документы о качестве.
+    '''
+    start_date = format_date(record.start_date)
+    next_work = format_text(record.concrete_type)
+    material = format_text(record.mixture_number)
+    material_data = format_text(record.mixture_volume)
+    lab_k = format_text(record.lab_k)
+    lab_date = format_date(record.lab_date)
+
+    act_date = get_act_date(record.end_date, record.lab_date,
+                            record.agreement_date)
+
+    if '\n' in material:
+        material_number_parts = material.split('\n')
+        material_date_parts = material_data.split('\n')
+        material1 = f'{material_number_parts[0]} - {material_date_parts[0]}'
+        material1_1 = (f'{material_number_parts[1]} - '
+                       f'{material_date_parts[1]}')
+        material2 = material_date_parts[0].capitalize()
+        material2_1 = material_date_parts[1].capitalize()
+    else:
+        material1 = f'{material} - {material_data}'
+        material2 = material_data.capitalize()
+        material1_1, material2_1 = '', ''
+
+    # Лабораторный контроль влажности и адгезии
+    if not lab_k:
+        lab1 = ''
+        lab2 = ''
+    else:
+        lab1 = f'{NAME_GI1} №{lab_k}-ВЛ/2/1.3В-2025 от {start_date}'
+        lab2 = f'{NAME_GI2} №{lab_k}-А/2/1.3В-2025 от {lab_date}'
+
+    if not next_work:
+        next_work = 'Согласно проекта'
+
+    replacements = common_replacements(record, act_date)
+    replacements.update({
+        '[Материалы1]': material1,
+        '[Материалы2]': material2,
+        '[Материалы1_1]': material1_1,
+        '[Материалы2_1]': material2_1,
+        '[Лаборатория1]': lab1,
+        '[Лаборатория2]': lab2,
+        '[Следующая работа]': next_work,
+    })
+    return replacements
+
+
+def build_arm(record):
+    '''Значения плейсхолдеров акта на армирование.
+
+    Армирование оформляется только по реестру материалов.
+    '''
+    act_number = str(record.act_number)
+    end_date = format_date(record.end_date)
+    mixture_number = str(record.mixture_number)
+
+    act_date = get_act_date(record.end_date, record.lab_date,
+                            record.agreement_date)
+
+    if mixture_number != 'Реестр':
+        raise ValueError(f"для армирования ожидается 'Реестр' "
+                         f"в столбце смеси, получено '{mixture_number}'")
+    material1 = f'Материалы согласно реестру №{act_number} от {end_date}'
+    material2 = f'Реестр №{act_number} от {end_date}'
+
+    replacements = common_replacements(record, act_date)
+    replacements.update({
+        '[Материалы1]': material1,
+        '[Материалы2]': material2,
+    })
+    return replacements
+
+
+DOCUMENT_TYPES = {
+    document.key: document for document in (
+        DocumentType(
+            key='beton',
+            title='бетонирование',
+            data_sheet='Бетон для АОСР',
+            template_file='Шаблон.xlsx',
+            template_sheet='АОСР бетон',
+            output_folder='Акты_бетон',
+            output_file='Все_акты_бетон.xlsx',
+            build=build_concrete,
+            check=check_concrete,
+            hidden_rows=(
+                (76, '[Материалы1_1]'),
+                (97, '[Материалы2_1]'),
+                (81, '[Лаборатория2]'),
+                (99, '[Лаборатория2]'),
+                (100, '[Согласование]'),
+            ),
+        ),
+        DocumentType(
+            key='gi',
+            title='гидроизоляцию',
+            data_sheet='ГИ для АОСР',
+            template_file='Шаблон ГИ.xlsx',
+            template_sheet='АОСР ГИ',
+            output_folder='Акты_ги',
+            output_file=None,
+            build=build_gi,
+            check=check_gi,
+            hidden_rows=(
+                (76, '[Материалы1_1]'),
+                (97, '[Материалы2_1]'),
+                (80, '[Лаборатория1]'),
+                (81, '[Лаборатория1]'),
+                (98, '[Лаборатория1]'),
+                (99, '[Лаборатория1]'),
+                (100, '[Согласование]'),
+            ),
+        ),
+        DocumentType(
+            key='arm',
+            title='армирование',
+            data_sheet='Армир для АОСР',
+            template_file='Шаблон арм.xlsx',
+            template_sheet='АОСР армир',
+            output_folder='Акты_армир',
+            output_file=None,
+            build=build_arm,
+            check=check_arm,
+            hidden_rows=(
+                (100, '[Согласование]'),
+            ),
+        ),
+    )
+}
+
+
+def build_act(document, record):
+    '''Значения плейсхолдеров и скрываемые строки для записи акта.'''
+    replacements = document.build(record)
+    rows_to_hide = [row_num for row_num, placeholder in document.hidden_rows
+                    if not replacements.get(placeholder)]
+    return replacements, rows_to_hide
+
+
+# Символы, недопустимые в имени листа Excel, и наибольшая длина имени
+INVALID_TITLE_CHARS = re.compile(r'[\\*?:/\[\]]')
+MAX_TITLE_LENGTH = 31
+
+
+def act_sheet_title(id):
+    '''Имя листа акта в общем файле.
+
+    ValueError, если Excel не примет такое имя: запрещённые символы или
+    длина больше 31 знака.
+    '''
+    title = f'Акт №{id}'
+    match = INVALID_TITLE_CHARS.search(title)
+    if match:
+        raise ValueError(f"недопустимый символ '{match.group(0)}' "
+                         f"в имени листа '{title}'")
+    if len(title) > MAX_TITLE_LENGTH:
+        raise ValueError(f"длина имени листа '{title}' больше "
+                         f"{MAX_TITLE_LENGTH}")
+    return title
+
+
+def check_act_ids(records):
+    '''Записи актов с ошибкой номера: (запись, текст ошибки или None).
+
+    Лист и файл акта называются по его номеру, поэтому ошибка — номер,
+    уже встречавшийся выше (без учёта регистра, как имена листов Excel),
+    или номер, из которого не получается имя листа. Записи без номера
+    проходят без проверки.
+    '''
+    seen = {}
+    for record in records:
+        if not record.id:
+            yield record, None
+            continue
+        try:
+            title = act_sheet_title(record.id)
+        except ValueError as e:
+            yield record, str(e)
+            continue
+        first = seen.setdefault(title.lower(), record.row_number)
+        if first != record.row_number:
+            yield record, f"номер повторяет акт из строки {first}"
+            continue
+        yield record, None
+
+
+def unique_acts(records):
+    '''Записи актов без повторяющихся номеров и недопустимых имён листов.
+
+    Строки с ошибкой номера (check_act_ids) пишутся в журнал как ошибки
+    и пропускаются.
+    '''
+    for record, error in check_act_ids(records):
+        if error:
+            logging.error(f"Ошибка в строке {record.row_number}, "
+                          f"акт №{record.id}: {error}, строка пропущена")
+            continue
+        yield record
@@ -0,0 +1,315 @@
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from act_cache import (CACHE_FOLDER, load_template_plan,
+                       load_template_workbook, load_xml_template,
+                       load_zip_template)
+from act_documents import build_act
+from act_manifest import record_hash
+from act_metrics import ActProgress, add_stage_time, format_size, stage
+from act_xml import InlineStrings, save_workbook
+from act_zip import pack_member
+
+# Глубина очередей конвейера по умолчанию: сколько актов на рабочий
+# процесс или поток может быть в пути одновременно
+SHEETS_IN_FLIGHT = 4
+
+# Потоки записи файлов актов в одном процессе (движки xml и stream):
+# сжатие и запись на диск идут параллельно с построением следующих актов
+SAVE_THREADS = 4
+
+
+def queue_limit(queue_depth, workers):
+    '''Глубина очереди конвейера: заданная или по числу исполнителей.'''
+    return queue_depth or workers * SHEETS_IN_FLIGHT
+
+
+class TemplateWorkbook:
+    '''Шаблон в памяти для записи отдельных файлов актов.
+
+    Книга загружается один раз. Для каждого акта заполняются ячейки
+    плана и скрываются строки, книга сохраняется в файл акта, после чего
+    исходные значения и видимость строк восстанавливаются.
+    '''
+
+    def __init__(self, template_file, sheet_name,
+                 cache_folder=CACHE_FOLDER, compression='normal'):
+        self.wb = load_template_workbook(template_file, cache_folder)
+        self.ws = self.wb[sheet_name]
+        self.plan, _ = load_template_plan(template_file, sheet_name,
+                                          cache_folder)
+        self.compression = compression
+        self.values = [
+            (slot.row, slot.column,
+             self.ws.cell(row=slot.row, column=slot.column).value)
+            for slot in self.plan.slots
+        ]
+
+    def save_act(self, path, replacements, rows_to_hide):
+        '''Сохраняет заполненную копию шаблона в файл акта.'''
+        ws = self.ws
+        hidden = {row_num: ws.row_dimensions[row_num].hidden
+                  for row_num in rows_to_hide}
+        try:
+            self.plan.fill(ws, replacements)
+            for row_num in rows_to_hide:
+                ws.row_dimensions[row_num].hidden = True
+            save_workbook(self.wb, path, self.compression)
+        finally:
+            for row, column, value in self.values:
+                ws.cell(row=row, column=column).value = value
+            for row_num, was_hidden in hidden.items():
+                ws.row_dimensions[row_num].hidden = was_hidden
+
+
+class PatchedTemplate:
+    '''Шаблон для записи файлов актов правкой zip-архива шаблона.
+
+    Части шаблона копируются в файл акта без пересжатия, заново пишутся
+    только лист акта и общие строки (см. act_xml.ZipFileTemplate).
+    '''
+
+    def __init__(self, template_file, sheet_name,
+                 cache_folder=CACHE_FOLDER, compression='normal',
+                 inline_strings=False):
+        self.template = load_zip_template(template_file, sheet_name,
+                                          cache_folder)
+        self.compression = compression
+        self.inline_strings = inline_strings
+
+    def save_act(self, path, replacements, rows_to_hide):
+        self.template.save_act(path, replacements, rows_to_hide,
+                               self.compression, self.inline_strings)
+
+
+# Шаблон рабочего процесса пула, загружается инициализатором
+_worker_template = None
+
+
+def _init_worker(template_file, sheet_name, cache_folder=CACHE_FOLDER,
+                 compression='normal', engine='openpyxl'):
+    global _worker_template
+    if engine == 'openpyxl':
+        _worker_template = TemplateWorkbook(template_file, sheet_name,
+                                            cache_folder, compression)
+    else:
+        _worker_template = PatchedTemplate(
+            template_file, sheet_name, cache_folder, compression,
+            inline_strings=engine == 'stream')
+
+
+def _save_act(task):
+    '''Запись одного акта в рабочем процессе: (id, путь, ошибка, время).'''
+    id, path, replacements, rows_to_hide = task
+    started = time.perf_counter()
+    try:
+        _worker_template.save_act(path, replacements, rows_to_hide)
+        error = None
+    except Exception as e:
+        error = str(e)
+    return id, path, error, time.perf_counter() - started
+
+
+def resume_files(records, entries, document, hashes):
+    '''Отделяет акты, файлы которых по журналу уже готовы.
+
+    Файл акта переиспользуется, если он на месте и строка данных не
+    изменилась. В hashes собираются хеши строк всех актов. Возвращает
+    (остальные записи, записи журнала для переноса, готовые файлы).
+    '''
+    records = [record for record in records if record.id]
+    for record in records:
+        hashes[str(record.id)] = record_hash(record)
+    done = [(meta, data) for meta, data in entries
+            if hashes.get(meta['id']) == meta['hash']
+            and os.path.exists(act_file_path(document, meta['id']))]
+    ready = {meta['id'] for meta, _ in done}
+    return ([record for record in records if str(record.id) not in ready],
+            done,
+            {id: act_file_path(document, id) for id in hashes if id in ready})
+
+
+def act_file_path(document, id):
+    return os.path.join(document.output_folder, f'Акт_№{id}.xlsx')
+
+
+def iter_tasks(records, document):
+    '''Задания на запись: (id, путь, замены, скрываемые строки).'''
+    for record in records:
+        if not record.id:
+            continue
+        id = record.id
+        try:
+            with stage('build'):
+                replacements, rows_to_hide = build_act(document, record)
+        except Exception as e:
+            logging.error(f"Ошибка при обработке акта №{id}: {e}")
+            continue
+        yield id, act_file_path(document, id), replacements, rows_to_hide
+
+
+def generate_act_files(records, document, jobs=1,
+                       cache_folder=CACHE_FOLDER, progress=None,
+                       compression='normal', engine='openpyxl',
+                       journal=None, resume=False, queue_depth=0):
+    '''Создаёт по файлу на акт, при jobs > 1 — в пуле процессов.
+
+    С движками xml и stream файл акта получается правкой zip-архива
+    шаблона, с openpyxl — сохранением книги шаблона. Акты строятся в
+    этом процессе, а файлы записываются в пуле процессов или, с xml и
+    stream при jobs = 1, в потоках; в пути не больше queue_depth актов
+    (0 — по числу исполнителей). Журнал ведётся в порядке строк данных
+    независимо от порядка завершения заданий.
+    В журнал готовых актов journal (act_journal.ActJournal) записывается
+    каждый сохранённый файл; с resume акты, файлы которых по журналу уже
+    готовы, не создаются заново.
+    Возвращает {id акта строкой: путь к файлу}.
+    '''
+    started = time.perf_counter()
+    outputs = {}
+    hashes = {}
+    done = []
+    if journal is not None:
+        entries = journal.load() if resume else []
+        records, done, outputs = resume_files(records, entries, document,
+                                              hashes)
+        journal.start(done)
+        if done:
+            logging.info(f"Продолжение: готово по журналу файлов "
+                         f"{len(done)}")
+    tasks = iter_tasks(records, document)
+    template_file = document.template_file
+    sheet_name = document.template_sheet
+    if progress is None:
+        progress = ActProgress(document.title, unit='файлов')
+
+    if jobs > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_worker,
+            initargs=(template_file, sheet_name, cache_folder,
+                      compression, engine))
+        results = iter_bounded(executor, _save_act, tasks,
+                               queue_limit(queue_depth, jobs))
+    else:
+        with stage('template_load'):
+            _init_worker(template_file, sheet_name, cache_folder,
+                         compression, engine)
+        if engine == 'openpyxl':
+            # Книга шаблона openpyxl меняется на месте при записи акта,
+            # поэтому файлы пишутся по одному
+            executor = None
+            results = map(_save_act, tasks)
+        else:
+            executor = ThreadPoolExecutor(max_workers=SAVE_THREADS)
+            results = iter_bounded(executor, _save_act, tasks,
+                                   queue_limit(queue_depth, SAVE_THREADS))
+
+    failed = 0
+    size = 0
+    try:
+        for id, path, error, elapsed in results:
+            add_stage_time('save_act', elapsed)
+            if error is None:
+                outputs[str(id)] = path
+                size += os.path.getsize(path)
+                progress.add(id)
+                if journal is not None:
+                    journal.add(id, hashes[str(id)])
+            else:
+                failed += 1
+                logging.error(f"Ошибка при записи акта №{id}: {error}")
+    finally:
+        progress.finish()
+        if executor is not None:
+            executor.shutdown()
+        if journal is not None:
+            journal.close()
+    if journal is not None and not failed:
+        journal.remove()
+
+    total = time.perf_counter() - started
+    created = len(outputs) - len(done)
+    logging.info(f"Обработка завершена. Создано файлов: {created}, "
+                 f"ошибок: {failed}, процессов: {max(jobs, 1)}, "
+                 f"время: {total:.1f} с, размер: {format_size(size)}")
+    print(f"Обработка завершена! Создано файлов: {created}, "
+          f"ошибок: {failed}, время: {total:.1f} с, "
+          f"размер: {format_size(size)}")
+    return outputs
+
+
+# Вид документа, лист шаблона и сжатие рабочего процесса подготовки
+# листов общего файла, загружаются инициализатором
+_worker_sheet = None
+
+
+def _init_sheet_worker(document, cache_folder=CACHE_FOLDER,
+                       compression='normal'):
+    global _worker_sheet
+    template = load_xml_template(document.template_file,
+                                 document.template_sheet, cache_folder)
+    # Таблица общих строк одна на книгу и ведётся в основном процессе,
+    # поэтому текст актов пишется прямо в ячейки
+    _worker_sheet = (document, template, InlineStrings(), compression)
+
+
+def _render_sheet(task):
+    '''Лист акта в рабочем процессе: (id, сжатый лист, ошибка, время).'''
+    record, reused = task
+    if reused:
+        return record.id, None, None, 0.0
+    document, template, strings, compression = _worker_sheet
+    started = time.perf_counter()
+    try:
+        replacements, rows_to_hide = build_act(document, record)
+        member = pack_member('', template.render(
+            replacements, frozenset(rows_to_hide), strings), compression)
+        error = None
+    except Exception as e:
+        member, error = None, str(e)
+    return record.id, member, error, time.perf_counter() - started
+
+
+def iter_bounded(executor, fn, items, limit):
+    '''Результаты fn(item) из пула в порядке items.
+
+    В отличие от executor.map, заданий в пути не больше limit: входные
+    данные читаются по мере выдачи результатов.
+    '''
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= limit:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def render_sheets(records, document, jobs, reuse=frozenset(),
+                  cache_folder=CACHE_FOLDER, compression='normal',
+                  queue_depth=0):
+    '''Листы актов общего файла, подготовленные в пуле процессов.
+
+    Рабочие процессы строят значения акта, отрисовывают XML листа и
+    сжимают его. Выдаются (id, сжатый лист) в порядке строк данных; для
+    актов из reuse лист — None. В пути не больше queue_depth листов
+    (0 — по числу процессов). Акты с ошибками пишутся в журнал и
+    пропускаются.
+    '''
+    tasks = ((record, record.id in reuse) for record in records
+             if record.id)
+    with ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_sheet_worker,
+            initargs=(document, cache_folder, compression)) as executor:
+        for id, member, error, elapsed in iter_bounded(
+                executor, _render_sheet, tasks,
+                queue_limit(queue_depth, jobs)):
+            if error is not None:
+                logging.error(f"Ошибка при обработке акта №{id}: {error}")
+                continue
+            if member is not None:
+                add_stage_time('render_sheet', elapsed)
+            yield id, member
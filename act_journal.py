@@ -0,0 +1,153 @@
+import itertools
+import json
+import logging
+import os
+import struct
+
+from act_manifest import record_hash, temp_path
+from act_zip import ZipMember
+
+
+# Запись журнала: длина описания (JSON) и длина данных, затем они сами.
+# Первая запись — ключ запуска без данных
+ENTRY_HEADER = struct.Struct('<II')
+
+# Через сколько записей журнал сбрасывается на диск (fsync). Между
+# сбросами записи уже переданы системе и переживают падение процесса,
+# но не отключение питания
+JOURNAL_SYNC_EVERY = 50
+
+
+def journal_path(output):
+    '''Путь к журналу рядом с общим файлом или папкой актов.'''
+    return os.path.normpath(output) + '.journal'
+
+
+class ActJournal:
+    '''Журнал готовых актов для продолжения прерванного запуска.
+
+    По каждому акту пишется id, хеш строки данных и, для общего файла,
+    сжатый лист с общими строками, добавленными при его отрисовке.
+    Журнал действителен, пока совпадает ключ запуска (шаблон, движок,
+    сжатие, версия генератора). Последняя запись, оборванная падением,
+    при чтении отбрасывается.
+    '''
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self.f = None
+        self.unsynced = 0
+
+    def load(self):
+        '''Записи журнала по порядку: [(описание, данные)].
+
+        Журнал другого запуска, отсутствующий или повреждённый — пустой
+        список.
+        '''
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        entries = []
+        offset = 0
+        while offset + ENTRY_HEADER.size <= len(data):
+            meta_size, data_size = ENTRY_HEADER.unpack_from(data, offset)
+            start = offset + ENTRY_HEADER.size
+            end = start + meta_size + data_size
+            if end > len(data):
+                break
+            try:
+                meta = json.loads(data[start:start + meta_size])
+            except ValueError:
+                break
+            entries.append((meta, data[start + meta_size:end]))
+            offset = end
+        if not entries or entries[0][0].get('key') != self.key:
+            if entries:
+                logging.warning(f"Журнал '{self.path}' записан другим "
+                                f"запуском (шаблон, движок или сжатие) "
+                                f"и не используется")
+            return []
+        return entries[1:]
+
+    def start(self, entries=()):
+        '''Начинает журнал запуска с перенесёнными записями entries.
+
+        entries — записи прочитанного журнала, которые остаются в силе;
+        остальные отбрасываются. Журнал переписывается через временный
+        файл, чтобы прежний не потерялся при падении в этот момент.
+        '''
+        tmp_path = temp_path(self.path)
+        self.f = open(tmp_path, 'wb')
+        self._write({'key': self.key})
+        for meta, data in entries:
+            self._write(meta, data)
+        self.f.close()
+        os.replace(tmp_path, self.path)
+        self.f = open(self.path, 'ab')
+
+    def _write(self, meta, data=b''):
+        meta = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+        self.f.write(ENTRY_HEADER.pack(len(meta), len(data)))
+        self.f.write(meta)
+        self.f.write(data)
+
+    def add(self, id, hash, title=None, member=None, strings=()):
+        '''Записывает готовый акт: файл акта или сжатый лист общего файла.'''
+        meta = {'id': str(id), 'hash': hash}
+        data = b''
+        if member is not None:
+            meta.update(title=title, method=member.method,
+                        time=member.dos_time, date=member.dos_date,
+                        crc=member.crc, size=member.size,
+                        strings=list(strings))
+            data = member.data
+        self._write(meta, data)
+        self.f.flush()
+        self.unsynced += 1
+        if self.unsynced >= JOURNAL_SYNC_EVERY:
+            os.fsync(self.f.fileno())
+            self.unsynced = 0
+
+    def close(self):
+        '''Закрывает журнал, оставляя его для продолжения (--resume).'''
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+    def remove(self):
+        '''Удаляет журнал после успешного завершения.'''
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def journal_member(meta, data):
+    '''Сжатый лист из записи журнала.'''
+    return ZipMember('', meta['method'], meta['time'], meta['date'],
+                     meta['crc'], meta['size'], data)
+
+
+def resume_prefix(records, entries):
+    '''Начало записей данных, уже готовое по журналу.
+
+    Записи журнала переиспользуются по порядку, пока совпадают id и хеш
+    строки данных: общий файл тогда получается тем же, что и без
+    прерывания. Возвращает (переиспользуемые записи журнала, остальные
+    записи данных).
+    '''
+    records = iter(records)
+    done = []
+    for record in records:
+        if not record.id:
+            continue
+        if len(done) < len(entries):
+            meta = entries[len(done)][0]
+            if (meta['id'] == str(record.id)
+                    and meta['hash'] == record_hash(record)):
+                done.append(entries[len(done)])
+                continue
+        return done, itertools.chain([record], records)
+    return done, records
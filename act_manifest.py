@@ -0,0 +1,157 @@
+import hashlib
+import json
+import logging
+import os
+import re
+
+
+# Версия генератора: увеличивается при изменении логики формирования актов,
+# чтобы инкрементальный режим пересобрал все акты
+GENERATOR_VERSION = '2'
+
+# Временный файл атомарной записи: имя итогового файла и номер процесса
+TEMP_SUFFIX = re.compile(r'\.(\d+)\.tmp$')
+
+
+def file_hash(path):
+    '''SHA-256 содержимого файла.'''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def temp_path(path):
+    '''Временный файл для атомарной записи path.
+
+    Номер процесса в имени не даёт одновременным запускам писать в один
+    временный файл; оставшиеся после падения файлы удаляет
+    remove_stale_temp.
+    '''
+    return f'{path}.{os.getpid()}.tmp'
+
+
+def process_running(pid):
+    '''Процесс pid ещё работает.
+
+    В Windows проверки нет (os.kill там завершает процесс), но файл,
+    открытый другим процессом, система и так не даст удалить.
+    '''
+    if pid == os.getpid():
+        return True
+    if os.name == 'nt':
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def remove_stale_temp(folder, prefix=''):
+    '''Удаляет из папки временные файлы (temp_path) упавших запусков.
+
+    Учитываются только файлы, чьё имя начинается с prefix. Файлы
+    работающих процессов не трогаются.
+    '''
+    try:
+        names = os.listdir(folder)
+    except FileNotFoundError:
+        return
+    for name in names:
+        match = TEMP_SUFFIX.search(name)
+        if (not name.startswith(prefix) or match is None
+                or process_running(int(match.group(1)))):
+            continue
+        path = os.path.join(folder, name)
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        logging.info(f"Удалён временный файл прерванного запуска '{path}'")
+
+
+def record_hash(record):
+    '''SHA-256 значений строки данных без номера строки листа.'''
+    values = [value.isoformat() if hasattr(value, 'isoformat') else value
+              for value in record[1:]]
+    data = json.dumps(values, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def manifest_path(output_folder):
+    '''Путь к манифесту рядом с папкой актов.'''
+    return os.path.normpath(output_folder) + '.manifest.json'
+
+
+class Manifest:
+    '''Манифест сформированных актов для инкрементальной генерации.
+
+    acts: id акта (строкой) -> {'hash': хеш строки данных,
+    'output': имя листа или путь к файлу акта}.
+    '''
+
+    def __init__(self, template_hash, acts=None,
+                 generator_version=GENERATOR_VERSION):
+        self.template_hash = template_hash
+        self.generator_version = generator_version
+        self.acts = acts if acts is not None else {}
+
+    @classmethod
+    def load(cls, path):
+        '''Читает манифест; при отсутствии или повреждении — None.'''
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            return cls(data['template_hash'], data['acts'],
+                       data['generator_version'])
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Манифест '{path}' не прочитан: {e}")
+            return None
+
+    def save(self, path):
+        '''Записывает манифест атомарно через временный файл.'''
+        data = {
+            'generator_version': self.generator_version,
+            'template_hash': self.template_hash,
+            'acts': self.acts,
+        }
+        tmp_path = temp_path(path)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+
+    def matches(self, template_hash):
+        '''Совпадают ли шаблон и версия генератора.'''
+        return (self.template_hash == template_hash
+                and self.generator_version == GENERATOR_VERSION)
+
+
+def plan_incremental(records, previous, template_hash, exists):
+    '''Разделяет записи на пересобираемые и переиспользуемые.
+
+    exists(output) проверяет, что прежний результат акта на месте.
+    Возвращает (записи, хеши по id, id переиспользуемых актов,
+    удалённые акты {id: output}).
+    '''
+    records = [record for record in records if record.id]
+    hashes = {str(record.id): record_hash(record) for record in records}
+
+    reuse = set()
+    removed = {}
+    if previous is not None:
+        if previous.matches(template_hash):
+            for record in records:
+                entry = previous.acts.get(str(record.id))
+                if (entry and entry['hash'] == hashes[str(record.id)]
+                        and exists(entry['output'])):
+                    reuse.add(record.id)
+        for id, entry in previous.acts.items():
+            if id not in hashes:
+                removed[id] = entry['output']
+    return records, hashes, reuse, removed
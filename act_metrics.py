@@ -0,0 +1,208 @@
+import json
+import logging
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+
+# Через сколько актов в журнал пишется сводная строка
+LOG_BATCH = 50
+
+# Как часто обновляется строка прогресса, секунды
+PROGRESS_INTERVAL = 0.5
+
+
+def format_size(size):
+    '''Размер файла для сообщений: 850 Б, 12.4 КБ, 3.1 МБ.'''
+    if size < 1024:
+        return f'{size} Б'
+    if size < 1 << 20:
+        return f'{size / 1024:.1f} КБ'
+    return f'{size / (1 << 20):.1f} МБ'
+
+
+class StageStats:
+    '''Накопленные замеры одного этапа.'''
+
+    __slots__ = ('calls', 'seconds', 'peak_bytes')
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.peak_bytes = None
+
+    def to_dict(self):
+        return {
+            'calls': self.calls,
+            'seconds': round(self.seconds, 4),
+            'peak_bytes': self.peak_bytes,
+        }
+
+
+class RunMetrics:
+    '''Замеры этапов запуска: время, число вызовов и пик памяти.
+
+    Пик памяти этапа измеряется tracemalloc, если трассировка включена.
+    Для вложенных этапов пик внутреннего учитывается и во внешнем.
+    '''
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.created = datetime.now()
+        self.stages = {}
+        self.acts = 0
+        self.peak_bytes = 0
+        self._open = []
+
+    def _stats(self, name):
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats()
+        return stats
+
+    def _fold_peak(self):
+        '''Переносит текущий пик tracemalloc во все открытые этапы.'''
+        peak = tracemalloc.get_traced_memory()[1]
+        self.peak_bytes = max(self.peak_bytes, peak)
+        for stats in self._open:
+            if stats.peak_bytes is None or peak > stats.peak_bytes:
+                stats.peak_bytes = peak
+
+    @contextmanager
+    def stage(self, name):
+        '''Замеряет блок кода как вызов этапа name.'''
+        stats = self._stats(name)
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            self._fold_peak()
+            tracemalloc.reset_peak()
+        self._open.append(stats)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats.seconds += time.perf_counter() - started
+            stats.calls += 1
+            if tracing:
+                self._fold_peak()
+            self._open.remove(stats)
+
+    def add(self, name, seconds):
+        '''Учитывает вызов этапа, замеренный в другом процессе.'''
+        stats = self._stats(name)
+        stats.calls += 1
+        stats.seconds += seconds
+
+    def timed_iter(self, name, iterable):
+        '''Итератор, время каждого шага которого относится к этапу name.'''
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def report(self):
+        '''Отчёт о запуске в виде словаря для JSON.'''
+        total = time.perf_counter() - self.started
+        report = {
+            'created': self.created.isoformat(timespec='seconds'),
+            'argv': sys.argv[1:],
+            'total_seconds': round(total, 3),
+            'acts': self.acts,
+            'acts_per_second': round(self.acts / total, 2) if total else None,
+            'stages': {name: stats.to_dict()
+                       for name, stats in self.stages.items()},
+        }
+        if tracemalloc.is_tracing():
+            report['peak_bytes'] = max(self.peak_bytes,
+                                       tracemalloc.get_traced_memory()[1])
+        return report
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=1)
+
+
+# Замеры текущего запуска
+metrics = RunMetrics()
+
+
+def reset_metrics():
+    '''Начинает замеры нового запуска.'''
+    global metrics
+    metrics = RunMetrics()
+    return metrics
+
+
+def stage(name):
+    '''Замер этапа текущего запуска: with stage('save'): ...'''
+    return metrics.stage(name)
+
+
+def add_stage_time(name, seconds):
+    '''Учитывает вызов этапа, замеренный в другом процессе.'''
+    metrics.add(name, seconds)
+
+
+class ActProgress:
+    '''Учёт готовых актов: сводные строки журнала и строка прогресса.
+
+    Вместо записи в журнал на каждый акт пишется одна строка на LOG_BATCH
+    актов. Строка прогресса со скоростью и оценкой оставшегося времени
+    выводится, только если stderr — терминал.
+    '''
+
+    def __init__(self, title, total=None, unit='листов'):
+        self.title = title
+        self.total = total
+        self.unit = unit
+        self.done = 0
+        self.batch = []
+        self.started = time.perf_counter()
+        self.shown = 0.0
+        self.interactive = sys.stderr.isatty()
+
+    def add(self, id):
+        '''Отмечает акт id готовым.'''
+        self.done += 1
+        metrics.acts += 1
+        self.batch.append(id)
+        if len(self.batch) >= LOG_BATCH:
+            self._log_batch()
+        if self.interactive:
+            now = time.perf_counter()
+            if now - self.shown >= PROGRESS_INTERVAL:
+                self.shown = now
+                self._show(now)
+
+    def _log_batch(self):
+        if self.batch:
+            logging.info(f"{self.title}: создано {self.unit} "
+                         f"{len(self.batch)} (акты №{self.batch[0]}–"
+                         f"№{self.batch[-1]}), всего {self.done}")
+            self.batch = []
+
+    def _show(self, now):
+        elapsed = now - self.started
+        rate = self.done / elapsed if elapsed else 0.0
+        line = f"{self.title}: {self.done}"
+        if self.total:
+            line += f"/{self.total}"
+        line += f", {rate:.1f} актов/с"
+        if self.total and rate:
+            remaining = max(self.total - self.done, 0) / rate
+            line += f", осталось ~{remaining:.0f} с"
+        sys.stderr.write(f"\r{line}\033[K")
+        sys.stderr.flush()
+
+    def finish(self):
+        '''Пишет последнюю сводную строку и завершает строку прогресса.'''
+        self._log_batch()
+        if self.interactive and self.shown:
+            sys.stderr.write('\r\033[K')
+            sys.stderr.flush()
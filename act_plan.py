@@ -0,0 +1,119 @@
+import csv
+import json
+import os
+import sys
+
+from act_documents import act_sheet_title, build_act, check_act_ids
+from act_files import act_file_path
+from act_template import compile_template
+
+
+# Столбцы CSV перед значениями плейсхолдеров
+PLAN_COLUMNS = ('document', 'row', 'id', 'output', 'hidden_rows',
+                'warnings', 'error')
+
+
+def act_output(document, id):
+    '''Куда будет записан акт: лист общего файла или отдельный файл.'''
+    if document.output_file:
+        path = os.path.join(document.output_folder, document.output_file)
+        return f'{path}!{act_sheet_title(id)}'
+    return act_file_path(document, id)
+
+
+def template_placeholders(ws_template):
+    '''Плейсхолдеры листа шаблона и видимые строки, где они стоят.
+
+    Плейсхолдеры строк, скрытых в самом шаблоне, на печать не попадают.
+    '''
+    placeholders = {}
+    plan = compile_template(ws_template)
+    for placeholder, cells in plan.placeholders.items():
+        rows = set()
+        for row, _ in cells:
+            dimension = ws_template.row_dimensions.get(row)
+            if dimension is None or not dimension.hidden:
+                rows.add(row)
+        placeholders[placeholder] = rows
+    return placeholders
+
+
+def plan_acts(document, records, placeholders=None):
+    '''План актов без записи файлов: значения, скрытые строки, замечания.
+
+    placeholders — результат template_placeholders(): плейсхолдеры
+    видимых строк без значения у акта попадают в предупреждения.
+    Номера проверяются так же, как при формировании: повторы и номера,
+    недопустимые в имени листа, — ошибки, такие акты не формируются.
+    '''
+    placeholders = placeholders or {}
+    for record, id_error in check_act_ids(records):
+        if not record.id:
+            continue
+        entry = {
+            'document': document.key,
+            'row': record.row_number,
+            'id': record.id,
+            'output': None,
+            'replacements': {},
+            'hidden_rows': [],
+            'warnings': document.check(record),
+            'error': id_error,
+        }
+        if id_error:
+            yield entry
+            continue
+        entry['output'] = act_output(document, record.id)
+        try:
+            replacements, rows_to_hide = build_act(document, record)
+        except Exception as e:
+            entry['error'] = f'{type(e).__name__}: {e}'
+        else:
+            entry['replacements'] = replacements
+            entry['hidden_rows'] = sorted(rows_to_hide)
+            missing = [placeholder
+                       for placeholder, rows in placeholders.items()
+                       if placeholder not in replacements
+                       and rows.difference(rows_to_hide)]
+            if missing:
+                entry['warnings'].append(
+                    f"нет значений для плейсхолдеров шаблона: "
+                    f"{', '.join(missing)}")
+        yield entry
+
+
+def write_plan(entries, path):
+    '''Записывает план в JSON или CSV (по расширению); '-' — stdout.'''
+    if path == '-':
+        write_plan_json(entries, sys.stdout)
+        sys.stdout.write('\n')
+        return
+    if path.lower().endswith('.csv'):
+        # utf-8-sig: Excel открывает CSV с кириллицей без перекодировки
+        with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+            write_plan_csv(entries, f)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            write_plan_json(entries, f)
+
+
+def write_plan_json(entries, f):
+    json.dump(entries, f, ensure_ascii=False, indent=1, default=str)
+
+
+def write_plan_csv(entries, f):
+    '''Строка на акт, столбец на каждый плейсхолдер.'''
+    placeholders = []
+    for entry in entries:
+        for placeholder in entry['replacements']:
+            if placeholder not in placeholders:
+                placeholders.append(placeholder)
+    writer = csv.writer(f, delimiter=';')
+    writer.writerow(PLAN_COLUMNS + tuple(placeholders))
+    for entry in entries:
+        writer.writerow(
+            [entry['document'], entry['row'], entry['id'], entry['output'],
+             ' '.join(map(str, entry['hidden_rows'])),
+             '; '.join(entry['warnings']), entry['error'] or '']
+            + [entry['replacements'].get(placeholder, '')
+               for placeholder in placeholders])
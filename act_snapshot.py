@@ -0,0 +1,352 @@
+import hashlib
+import logging
+import os
+import sqlite3
+from datetime import date, datetime, time
+from urllib.request import pathname2url
+
+from act_cache import CACHE_FOLDER
+from act_data import ACT_COLUMNS, ActRecord, WorkbookData
+from act_manifest import file_hash, remove_stale_temp, temp_path
+
+
+# Версия формата снимка: увеличивается при изменении схемы или чтения
+# листов данных, чтобы старые снимки были пересобраны
+SNAPSHOT_VERSION = '2'
+
+# Начало файла базы SQLite: так снимок отличается от книги Excel
+SQLITE_HEADER = b'SQLite format 3\x00'
+
+FIELDS = tuple(field for field, _ in ACT_COLUMNS)
+
+# Схема снимка. Другие программы могут записать строки актов сами, без
+# книги xlsx: листы в sheets, по строке данных в records. Поля records —
+# как у ActRecord: числа или текст, даты и время — текстом ISO
+# (ГГГГ-ММ-ДД, ГГГГ-ММ-ДДTЧЧ:ММ:СС, ЧЧ:ММ:СС). types — по знаку на поле:
+# d — дата, t — дата-время, h — время, любой другой знак — значение как
+# есть. Без types (NULL) все значения читаются как есть, поэтому текст,
+# похожий на дату, датой не становится.
+SCHEMA = f'''
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE sheets (name TEXT PRIMARY KEY);
+CREATE TABLE records (
+    sheet TEXT NOT NULL,
+    row_number INTEGER NOT NULL,
+    {', '.join(FIELDS)},
+    types TEXT,
+    PRIMARY KEY (sheet, row_number)
+);
+'''
+INSERT_RECORD = (f"INSERT INTO records (sheet, row_number, "
+                 f"{', '.join(FIELDS)}, types) "
+                 f"VALUES ({', '.join('?' * (len(FIELDS) + 3))})")
+SELECT_RECORDS = (f"SELECT row_number, {', '.join(FIELDS)}, types "
+                  f"FROM records WHERE sheet = ? ORDER BY row_number")
+
+# Знак типа в types -> чтение значения из текста ISO. datetime
+# проверяется раньше date: это его подкласс
+VALUE_TYPES = (
+    ('t', datetime, datetime.fromisoformat),
+    ('d', date, date.fromisoformat),
+    ('h', time, time.fromisoformat),
+)
+PARSERS = {code: parse for code, _, parse in VALUE_TYPES}
+
+
+def stored_value(value):
+    '''Значение поля для записи в SQLite и знак его типа для types.'''
+    for code, value_type, _ in VALUE_TYPES:
+        if isinstance(value, value_type):
+            return value.isoformat(), code
+    if value is None or isinstance(value, (int, float, str)):
+        return value, '.'
+    return str(value), '.'
+
+
+def loaded_value(value, code):
+    '''Значение поля из SQLite: даты и время — по знаку типа.'''
+    parse = PARSERS.get(code)
+    if parse is not None and isinstance(value, str):
+        return parse(value)
+    return value
+
+
+def record_row(sheet_name, record):
+    '''Строка таблицы records для записи ActRecord.'''
+    values, codes = zip(*map(stored_value, record[1:]))
+    return (sheet_name, record.row_number, *values, ''.join(codes))
+
+
+def is_snapshot(path):
+    '''Файл — снимок данных SQLite, а не книга Excel.'''
+    with open(path, 'rb') as f:
+        return f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+
+
+def snapshot_path(data_file, cache_folder=CACHE_FOLDER):
+    '''Путь к снимку книги данных в папке кеша.
+
+    Одноимённые книги из разных папок получают разные снимки.
+    '''
+    name = os.path.splitext(os.path.basename(data_file))[0]
+    key = hashlib.sha256(
+        os.path.abspath(data_file).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(cache_folder, f'{name}.{key}.snapshot.sqlite')
+
+
+def create_snapshot(path, meta=None):
+    '''Новая база снимка со схемой и метаданными, открытая для записи.'''
+    if os.path.exists(path):
+        os.remove(path)
+    # Записи могут читаться генерацией в другом потоке; обращения к
+    # базе при этом идут по очереди
+    conn = sqlite3.connect(path, check_same_thread=False)
+    try:
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.executescript(SCHEMA)
+        meta = {'version': SNAPSHOT_VERSION, 'columns': ','.join(FIELDS),
+                **(meta or {})}
+        conn.executemany('INSERT INTO meta VALUES (?, ?)',
+                         [(key, str(value)) for key, value in meta.items()])
+    except BaseException:
+        conn.close()
+        raise
+    return conn
+
+
+def write_snapshot(path, sheets, meta=None):
+    '''Записывает снимок: sheets — {имя листа: записи ActRecord}.
+
+    Снимок пишется во временный файл и заменяет старый целиком, поэтому
+    читающий его процесс не увидит недописанную базу.
+    '''
+    tmp_path = temp_path(path)
+    conn = create_snapshot(tmp_path, meta)
+    try:
+        for name, records in sheets.items():
+            conn.execute('INSERT INTO sheets VALUES (?)', (name,))
+            conn.executemany(INSERT_RECORD, (
+                record_row(name, record) for record in records))
+        conn.commit()
+    except BaseException:
+        conn.close()
+        os.remove(tmp_path)
+        raise
+    conn.close()
+    os.replace(tmp_path, path)
+
+
+class DataSnapshot:
+    '''Снимок листов книги данных в SQLite.
+
+    Записи читаются запросом к базе, без разбора xlsx. Интерфейс тот
+    же, что у act_data.WorkbookData.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        uri = f'file:{pathname2url(os.path.abspath(path))}?mode=ro'
+        self.conn = sqlite3.connect(uri, uri=True)
+        try:
+            self.meta = dict(self.conn.execute('SELECT key, value FROM meta'))
+            self.sheetnames = [
+                name for name, in self.conn.execute('SELECT name FROM sheets')]
+        except BaseException:
+            self.conn.close()
+            raise
+
+    def _check_sheet(self, sheet_name):
+        if sheet_name not in self.sheetnames:
+            raise KeyError(f"Лист '{sheet_name}' не найден в снимке "
+                           f"данных '{self.path}'")
+
+    def count_records(self, sheet_name):
+        '''Число строк данных листа.'''
+        self._check_sheet(sheet_name)
+        (count,), = self.conn.execute(
+            'SELECT count(*) FROM records WHERE sheet = ?', (sheet_name,))
+        return count
+
+    def sheet_records(self, sheet_name):
+        '''Записи ActRecord листа в порядке строк.'''
+        self._check_sheet(sheet_name)
+        for row in self.conn.execute(SELECT_RECORDS, (sheet_name,)):
+            *values, codes = row
+            if codes is not None:
+                codes = codes.ljust(len(FIELDS), '.')
+                values[1:] = map(loaded_value, values[1:], codes)
+            yield ActRecord._make(values)
+
+    def close(self):
+        self.conn.close()
+
+
+def data_signature(data_file):
+    '''Размер и время изменения книги данных.'''
+    stat = os.stat(data_file)
+    return str(stat.st_size), str(stat.st_mtime_ns)
+
+
+def open_valid_snapshot(path, data_file, sheet_names):
+    '''Снимок книги данных, если он актуален и содержит нужные листы.
+
+    Снимок актуален, пока совпадают размер и время изменения книги.
+    Если они изменились, а содержимое нет (файл пересохранён или
+    скопирован), сверяется хеш и подпись снимка обновляется.
+    '''
+    try:
+        snapshot = DataSnapshot(path)
+    except sqlite3.Error:
+        return None
+    meta = snapshot.meta
+    workbook_sheets = meta.get('workbook_sheets', '').split('\n')
+    valid = (
+        meta.get('version') == SNAPSHOT_VERSION
+        and meta.get('columns') == ','.join(FIELDS)
+        and all(name in snapshot.sheetnames for name in sheet_names
+                if name in workbook_sheets))
+    if valid:
+        size, mtime = data_signature(data_file)
+        if (size, mtime) != (meta.get('size'), meta.get('mtime_ns')):
+            valid = meta.get('sha256') == file_hash(data_file)
+            if valid:
+                update_signature(path, size, mtime)
+    if not valid:
+        snapshot.close()
+        return None
+    return snapshot
+
+
+def update_signature(path, size, mtime):
+    '''Записывает в снимок новые размер и время изменения книги.'''
+    try:
+        conn = sqlite3.connect(path)
+        try:
+            conn.executemany('UPDATE meta SET value = ? WHERE key = ?',
+                             [(size, 'size'), (mtime, 'mtime_ns')])
+            conn.commit()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logging.warning(f"Снимок данных '{path}' не обновлён: {e}")
+
+
+class SnapshotBuilder:
+    '''Книга данных xlsx, разбираемая в снимок по ходу чтения.
+
+    Записи листа выдаются сразу по мере разбора книги, как у
+    act_data.WorkbookData, и тут же пишутся во временную базу снимка:
+    первый запуск не ждёт разбора всей книги. При закрытии в снимок
+    дописываются листы, которые запуск не читал (запрошенные и из
+    прежнего снимка), и он заменяет прежний. Если лист прочитан не до
+    конца (запуск прерван), снимок не сохраняется.
+    '''
+
+    def __init__(self, path, data_file, sheet_names):
+        previous = []
+        try:
+            snapshot = DataSnapshot(path)
+            previous = snapshot.sheetnames
+            snapshot.close()
+        except sqlite3.Error:
+            pass
+        self.path = path
+        self.tmp_path = temp_path(path)
+        # Недописанные снимки прерванных запусков
+        remove_stale_temp(os.path.dirname(path) or '.',
+                          os.path.basename(path))
+        self.data = WorkbookData(data_file)
+        self.sheetnames = self.data.sheetnames
+        size, mtime = data_signature(data_file)
+        meta = {'source': os.path.abspath(data_file), 'size': size,
+                'mtime_ns': mtime, 'sha256': file_hash(data_file),
+                'workbook_sheets': '\n'.join(self.sheetnames)}
+        self.names = [name for name in dict.fromkeys([*sheet_names, *previous])
+                      if name in self.sheetnames]
+        self.started = set()
+        self.finished = set()
+        try:
+            self.conn = create_snapshot(self.tmp_path, meta)
+        except BaseException:
+            self.data.close()
+            raise
+
+    def count_records(self, sheet_name):
+        return self.data.count_records(sheet_name)
+
+    def sheet_records(self, sheet_name):
+        '''Записи ActRecord листа; первое чтение листа пишется в снимок.'''
+        if sheet_name in self.started or self.conn is None:
+            yield from self.data.sheet_records(sheet_name)
+            return
+        self.started.add(sheet_name)
+        records = self.data.sheet_records(sheet_name)
+        self._execute('INSERT INTO sheets VALUES (?)', (sheet_name,))
+        for record in records:
+            self._execute(INSERT_RECORD, record_row(sheet_name, record))
+            yield record
+        self.finished.add(sheet_name)
+
+    def _execute(self, sql, parameters):
+        '''Запрос к снимку; после ошибки снимок больше не пишется.'''
+        if self.conn is None:
+            return
+        try:
+            self.conn.execute(sql, parameters)
+        except sqlite3.Error as e:
+            logging.warning(f"Снимок данных '{self.path}' не записан: {e}")
+            self._discard()
+
+    def _discard(self):
+        self.conn.close()
+        self.conn = None
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def close(self):
+        '''Дописывает и сохраняет снимок, закрывает книгу данных.'''
+        try:
+            if self.conn is not None and self.started <= self.finished:
+                for name in self.names:
+                    if name not in self.started:
+                        for _ in self.sheet_records(name):
+                            pass
+            if self.conn is not None and self.started <= self.finished:
+                self.conn.commit()
+                self.conn.close()
+                self.conn = None
+                os.replace(self.tmp_path, self.path)
+        except (OSError, sqlite3.Error) as e:
+            logging.warning(f"Снимок данных '{self.path}' не записан: {e}")
+        finally:
+            if self.conn is not None:
+                self._discard()
+            self.data.close()
+
+
+def open_data(data_file, sheet_names, cache_folder=CACHE_FOLDER):
+    '''Источник записей книги данных для листов sheet_names.
+
+    Снимок SQLite (см. SCHEMA) читается напрямую. Книга xlsx при первом
+    запуске разбирается в снимок в папке кеша по ходу генерации
+    (SnapshotBuilder), следующие запуски читают снимок, пока книга не
+    изменится. При cache_folder=None или ошибке создания снимка книга
+    читается через openpyxl.
+    '''
+    if is_snapshot(data_file):
+        return DataSnapshot(data_file)
+    if cache_folder is None:
+        return WorkbookData(data_file)
+
+    path = snapshot_path(data_file, cache_folder)
+    snapshot = open_valid_snapshot(path, data_file, sheet_names)
+    if snapshot is not None:
+        logging.info(f"Данные '{data_file}' загружены из снимка")
+        return snapshot
+    try:
+        os.makedirs(cache_folder, exist_ok=True)
+        return SnapshotBuilder(path, data_file, sheet_names)
+    except (OSError, sqlite3.Error) as e:
+        logging.warning(f"Снимок данных '{path}' не записан: {e}")
+        return WorkbookData(data_file)
@@ -0,0 +1,213 @@
+import re
+
+from openpyxl.cell.cell import Cell, MergedCell
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.styles.numbers import BUILTIN_FORMATS_MAX_SIZE
+from openpyxl.worksheet.merge import MergedCellRange
+
+
+# Плейсхолдер в шаблоне: любой текст в квадратных скобках, например [№ акта]
+PLACEHOLDER_PATTERN = re.compile(r'(\[[^\[\]\n]+\])')
+
+
+class CellSlot:
+    '''Ячейка шаблона с плейсхолдерами, разобранная на части.
+
+    parts чередует литералы и плейсхолдеры: чётные элементы — текст
+    шаблона, нечётные — имена плейсхолдеров (как у re.split с группой).
+    '''
+
+    __slots__ = ('row', 'column', 'parts')
+
+    def __init__(self, row, column, parts):
+        self.row = row
+        self.column = column
+        self.parts = parts
+
+    @property
+    def placeholders(self):
+        return self.parts[1::2]
+
+    def render(self, replacements):
+        '''Собирает значение ячейки за один проход по частям.'''
+        parts = self.parts
+        chunks = [parts[0]]
+        for i in range(1, len(parts), 2):
+            placeholder = parts[i]
+            chunks.append(replacements.get(placeholder, placeholder))
+            chunks.append(parts[i + 1])
+        return ''.join(chunks)
+
+
+class TemplatePlan:
+    '''Скомпилированный план заполнения листа шаблона.
+
+    Шаблон сканируется один раз, после чего заполнение акта затрагивает
+    только ячейки с плейсхолдерами.
+    '''
+
+    __slots__ = ('slots', 'placeholders')
+
+    def __init__(self, slots):
+        self.slots = slots
+        # Индекс: плейсхолдер -> список координат (строка, столбец)
+        self.placeholders = {}
+        for slot in slots:
+            for placeholder in slot.placeholders:
+                self.placeholders.setdefault(placeholder, []).append(
+                    (slot.row, slot.column))
+
+    def render(self, replacements):
+        '''Возвращает (строка, столбец, значение) для каждой ячейки плана.'''
+        for slot in self.slots:
+            yield slot.row, slot.column, slot.render(replacements)
+
+    def fill(self, ws, replacements):
+        '''Заполняет лист значениями плейсхолдеров.'''
+        for row, column, value in self.render(replacements):
+            ws.cell(row=row, column=column).value = value
+
+
+def compile_template(ws_template):
+    '''Сканирует лист шаблона и строит план заполнения.'''
+    slots = []
+    for row in ws_template.iter_rows():
+        for cell in row:
+            value = cell.value
+            if not isinstance(value, str) or '[' not in value:
+                continue
+            parts = PLACEHOLDER_PATTERN.split(value)
+            if len(parts) > 1:
+                slots.append(CellSlot(cell.row, cell.column, tuple(parts)))
+    return TemplatePlan(slots)
+
+
+# Коллекции стилей книги и соответствующие поля StyleArray
+STYLE_COLLECTIONS = (
+    ('fontId', '_fonts'),
+    ('fillId', '_fills'),
+    ('borderId', '_borders'),
+    ('protectionId', '_protections'),
+    ('alignmentId', '_alignments'),
+)
+
+
+class SheetLayout:
+    '''Разобранный лист шаблона для SheetCloner.
+
+    Ячейки хранятся с индексами стилей книги шаблона, поэтому разметка
+    не зависит от целевой книги и кешируется вместе с планом заполнения
+    (act_cache.load_template_plan).
+    '''
+
+    __slots__ = ('cells', 'row_dimensions', 'column_dimensions',
+                 'merged_ranges')
+
+    def __init__(self, source_ws):
+        self.cells = []
+        for (row, column), cell in sorted(source_ws._cells.items()):
+            style = cell._style
+            style = tuple(style) if style is not None and any(style) else None
+            if isinstance(cell, MergedCell):
+                self.cells.append((row, column, None, None, style, True))
+            else:
+                self.cells.append((row, column, cell._value,
+                                   cell.data_type, style, False))
+
+        self.row_dimensions = [
+            (row_num, dim.height, dim.hidden)
+            for row_num, dim in source_ws.row_dimensions.items()
+        ]
+        self.column_dimensions = [
+            (col_letter, dim.width, dim.hidden)
+            for col_letter, dim in source_ws.column_dimensions.items()
+        ]
+        self.merged_ranges = [
+            merged.coord for merged in source_ws.merged_cells.ranges
+        ]
+
+
+class SheetCloner:
+    '''Быстрое клонирование листа шаблона в другую книгу.
+
+    Ячейки, индексы стилей, объединения и размеры шаблона разбираются
+    один раз (или берутся готовыми из layout). Клон создаётся без
+    разбора координат и без копирования объектов стилей: ячейкам
+    передаются готовые индексы стилей целевой книги.
+    '''
+
+    def __init__(self, source_ws, target_wb, layout=None):
+        self.source_ws = source_ws
+        self.target_wb = target_wb
+        self._style_map = {}
+
+        if layout is None:
+            layout = SheetLayout(source_ws)
+        self.cells = [
+            (row, column, value, data_type, self._map_style(style), merged)
+            for row, column, value, data_type, style, merged in layout.cells
+        ]
+        self.row_dimensions = layout.row_dimensions
+        self.column_dimensions = layout.column_dimensions
+        self.merged_ranges = layout.merged_ranges
+
+    def _map_style(self, style):
+        '''Переводит индексы стилей шаблона в индексы целевой книги.'''
+        if style is None:
+            return None
+        mapped = self._style_map.get(style)
+        if mapped is not None:
+            return mapped
+
+        source_wb = self.source_ws.parent
+        source = StyleArray(style)
+        mapped = StyleArray(style)
+        if source_wb is not self.target_wb:
+            for field, collection in STYLE_COLLECTIONS:
+                value = getattr(source_wb, collection)[getattr(source, field)]
+                setattr(mapped, field,
+                        getattr(self.target_wb, collection).add(value))
+            if source.numFmtId >= BUILTIN_FORMATS_MAX_SIZE:
+                number_format = source_wb._number_formats[
+                    source.numFmtId - BUILTIN_FORMATS_MAX_SIZE]
+                mapped.numFmtId = (
+                    self.target_wb._number_formats.add(number_format)
+                    + BUILTIN_FORMATS_MAX_SIZE)
+            # Именованные стили не переносятся, как и при copy()
+            mapped.xfId = 0
+        self._style_map[style] = mapped
+        return mapped
+
+    def clone(self, title):
+        '''Создаёт в целевой книге копию листа шаблона.'''
+        target_ws = self.target_wb.create_sheet(title=title)
+        target_cells = target_ws._cells
+
+        for row, column, value, data_type, style, merged in self.cells:
+            if merged:
+                cell = MergedCell(target_ws, row, column)
+                if style is not None:
+                    cell._style = StyleArray(style)
+            else:
+                cell = Cell(target_ws, row=row, column=column,
+                            style_array=style)
+                cell._value = value
+                cell.data_type = data_type
+            target_cells[row, column] = cell
+
+        for row_num, height, hidden in self.row_dimensions:
+            dimension = target_ws.row_dimensions[row_num]
+            dimension.height = height
+            dimension.hidden = hidden
+
+        for col_letter, width, hidden in self.column_dimensions:
+            dimension = target_ws.column_dimensions[col_letter]
+            dimension.width = width
+            dimension.hidden = hidden
+
+        # Ячейки-продолжения объединений уже созданы со своими стилями,
+        # поэтому диапазоны добавляются без merge_cells
+        for coord in self.merged_ranges:
+            target_ws.merged_cells.add(MergedCellRange(target_ws, coord))
+
+        return target_ws
@@ -0,0 +1,70 @@
+import logging
+import os
+import time
+
+
+# Период опроса файлов по умолчанию, секунды
+WATCH_INTERVAL = 0.5
+
+
+def file_signature(path):
+    '''Время изменения и размер файла или None, если файла нет.'''
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class FileWatcher:
+    '''Отслеживание сохранений файлов опросом, без системных уведомлений.
+
+    Изменение засчитывается, когда новое состояние файлов продержалось
+    один период опроса: Excel пишет книгу не мгновенно и может на время
+    сохранения убирать файл. Отсутствующий файл не мешает замечать
+    изменения остальных: он сравнивается, когда появится снова.
+    '''
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+        self.snapshot = self._snapshot()
+        self.pending = None
+        # Файлы, об отсутствии которых уже предупреждали
+        self.missing = set()
+
+    def _snapshot(self):
+        return {path: file_signature(path) for path in self.paths}
+
+    def poll(self):
+        '''Файлы, изменившиеся с прошлого снимка и уже сохранённые.'''
+        current = self._snapshot()
+        if current == self.snapshot:
+            self.pending = None
+            return []
+        if current != self.pending:
+            # Файл ещё записывается или временно отсутствует
+            self.pending = current
+            return []
+        changed = []
+        for path in self.paths:
+            signature = current[path]
+            if signature is None:
+                if path not in self.missing:
+                    logging.warning(f"Файл '{path}' не найден, изменения "
+                                    f"отслеживаются до его появления")
+                    self.missing.add(path)
+                continue
+            self.missing.discard(path)
+            if signature != self.snapshot[path]:
+                changed.append(path)
+                self.snapshot[path] = signature
+        self.pending = current
+        return changed
+
+    def wait(self, interval=WATCH_INTERVAL):
+        '''Ждёт сохранения файлов и возвращает список изменившихся.'''
+        while True:
+            time.sleep(interval)
+            changed = self.poll()
+            if changed:
+                return changed
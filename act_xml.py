@@ -0,0 +1,654 @@
+import functools
+import os
+import posixpath
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape, quoteattr, unescape
+
+from openpyxl.utils.cell import coordinate_to_tuple
+from openpyxl.writer.excel import ExcelWriter
+
+from act_manifest import temp_path
+from act_template import PLACEHOLDER_PATTERN, CellSlot
+from act_zip import (ZipWriter, ZipWriterThread, open_zip, pack_member,
+                     read_members, write_members)
+
+
+NS_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+NS_REL = ('http://schemas.openxmlformats.org/officeDocument/2006/'
+          'relationships')
+NS_PKG_REL = 'http://schemas.openxmlformats.org/package/2006/relationships'
+NS_CT = 'http://schemas.openxmlformats.org/package/2006/content-types'
+
+REL_TYPE = NS_REL + '/'
+CT_SHEET = ('application/vnd.openxmlformats-officedocument.'
+            'spreadsheetml.worksheet+xml')
+CT_WORKBOOK = ('application/vnd.openxmlformats-officedocument.'
+               'spreadsheetml.sheet.main+xml')
+CT_SHARED_STRINGS = ('application/vnd.openxmlformats-officedocument.'
+                     'spreadsheetml.sharedStrings+xml')
+CT_CORE = 'application/vnd.openxmlformats-package.core-properties+xml'
+CT_RELS = 'application/vnd.openxmlformats-package.relationships+xml'
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+# Разбор XML листа: открывающие теги строк и ячейки целиком
+SHEET_TOKEN = re.compile(
+    r'<row\b[^>]*>|<c\b[^>]*?/>|<c\b[^>]*>.*?</c>', re.S)
+ATTRIBUTE = re.compile(r'\s([\w:]+)="([^"]*)"')
+TEXT_RUN = re.compile(r'<t(?:\s[^>]*)?>(.*?)</t>', re.S)
+PHONETIC_RUN = re.compile(r'<rPh\b.*?</rPh>', re.S)
+SHARED_STRING = re.compile(r'<si>.*?</si>|<si/>', re.S)
+
+# Части, принадлежащие одному листу: каждый лист книги актов получает
+# свою копию, а изображения, на которые они ссылаются, остаются общими
+SHEET_OWN_PARTS = ('drawing', 'vmlDrawing', 'comments')
+
+
+def save_workbook(wb, path, compression='normal'):
+    '''Сохраняет книгу openpyxl с заданным сжатием zip.
+
+    То же, что wb.save(path), но со своим уровнем сжатия. Книга пишется
+    во временный файл и заменяет итоговый, только когда записана целиком.
+    '''
+    wb.properties.modified = datetime.now(timezone.utc).replace(tzinfo=None)
+    tmp_path = temp_path(path)
+    try:
+        ExcelWriter(wb, open_zip(tmp_path, compression)).save()
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+def part_name(base, target):
+    '''Абсолютное имя части пакета по относительной ссылке.'''
+    if target.startswith('/'):
+        return target[1:]
+    return posixpath.normpath(posixpath.join(posixpath.dirname(base), target))
+
+
+def rels_name(name):
+    '''Имя части связей для указанной части пакета.'''
+    folder, file_name = posixpath.split(name)
+    return posixpath.join(folder, '_rels', file_name + '.rels')
+
+
+def read_rels(zf, source):
+    '''Связи части пакета: rId -> (тип, абсолютное имя части).'''
+    name = rels_name(source) if source else '_rels/.rels'
+    if name not in zf.namelist():
+        return {}
+    rels = {}
+    for rel in ET.fromstring(zf.read(name)):
+        rel_type = rel.get('Type').rsplit('/', 1)[-1]
+        target = None
+        if rel.get('TargetMode') != 'External':
+            target = part_name(source, rel.get('Target'))
+        rels[rel.get('Id')] = (rel_type, target)
+    return rels
+
+
+def read_sheet_parts(zf):
+    '''Имена листов книги и их части: [(имя, часть листа)].'''
+    workbook = ET.fromstring(zf.read('xl/workbook.xml'))
+    workbook_rels = read_rels(zf, 'xl/workbook.xml')
+    return [
+        (sheet.get('name'), workbook_rels[sheet.get(f'{{{NS_REL}}}id')][1])
+        for sheet in workbook.iter(f'{{{NS_MAIN}}}sheet')
+    ]
+
+
+def own_part_name(name, index):
+    '''Имя копии части листа для листа index: drawing1.xml -> drawing5.xml.'''
+    folder, file_name = posixpath.split(name)
+    stem, ext = posixpath.splitext(file_name)
+    return posixpath.join(folder, f"{stem.rstrip('0123456789')}{index}{ext}")
+
+
+def quote_sheet_name(title):
+    '''Имя листа для ссылок в формулах и именованных диапазонах.'''
+    return "'" + title.replace("'", "''") + "'"
+
+
+def string_text(si):
+    '''Текст элемента <si> общей строки без фонетических подсказок.'''
+    si = PHONETIC_RUN.sub('', si)
+    return ''.join(unescape(text) for text in TEXT_RUN.findall(si))
+
+
+class SharedStrings:
+    '''Таблица общих строк выходной книги с дедупликацией.'''
+
+    def __init__(self, template_items=()):
+        # Исходные элементы <si> шаблона сохраняются как есть, чтобы не
+        # терять форматирование частей текста
+        self.items = list(template_items)
+        self.index = {}
+        for index, item in enumerate(self.items):
+            if item.startswith('<si><t') and '<r>' not in item:
+                self.index.setdefault(string_text(item), index)
+
+    def extend(self, items):
+        '''Добавляет готовые элементы <si> (из журнала прерванного запуска).'''
+        for item in items:
+            self.index.setdefault(string_text(item), len(self.items))
+            self.items.append(item)
+
+    def add(self, text):
+        index = self.index.get(text)
+        if index is None:
+            index = len(self.items)
+            self.items.append(
+                f'<si><t xml:space="preserve">{escape(text)}</t></si>')
+            self.index[text] = index
+        return index
+
+    def cell(self, head, text):
+        '''Строковая ячейка со ссылкой на общую строку.'''
+        return f'{head} t="s"><v>{self.add(text)}</v></c>'
+
+    def to_xml(self):
+        return (f'{XML_HEADER}<sst xmlns="{NS_MAIN}" '
+                f'uniqueCount="{len(self.items)}">'
+                + ''.join(self.items) + '</sst>')
+
+
+class InlineStrings(SharedStrings):
+    '''Общие строки шаблона без добавления строк актов.
+
+    Текст актов пишется в ячейки как встроенная строка (inlineStr),
+    поэтому таблица не растёт и память не зависит от числа актов.
+    '''
+
+    def cell(self, head, text):
+        return (f'{head} t="inlineStr"><is><t xml:space="preserve">'
+                f'{escape(text)}</t></is></c>')
+
+
+class XmlRowSlot:
+    '''Открывающий тег строки, которую можно скрыть.'''
+
+    __slots__ = ('row', 'tag', 'hidden_tag')
+
+    def __init__(self, row, tag):
+        self.row = row
+        self.tag = tag
+        if tag.endswith('/>'):
+            self.hidden_tag = tag[:-2] + ' hidden="1"/>'
+        else:
+            self.hidden_tag = tag[:-1] + ' hidden="1">'
+
+    def render(self, replacements, hidden_rows, strings):
+        return self.hidden_tag if self.row in hidden_rows else self.tag
+
+
+class XmlCellSlot:
+    '''Ячейка XML листа с плейсхолдерами.'''
+
+    __slots__ = ('slot', 'head', 'formula')
+
+    def __init__(self, slot, head, formula):
+        self.slot = slot
+        self.head = head
+        self.formula = formula
+
+    def render(self, replacements, hidden_rows, strings):
+        text = self.slot.render(replacements)
+        if self.formula is not None:
+            # Формула сохраняется, подставляется только кешированный текст
+            return (f'{self.head} t="str">{self.formula}'
+                    f'<v>{escape(text)}</v></c>')
+        if not text:
+            return self.head + '/>'
+        return strings.cell(self.head, text)
+
+
+class XmlSheetTemplate:
+    '''Лист шаблона, разобранный как байтовый шаблон XML.
+
+    XML листа режется на неизменяемые куски и слоты: открывающие теги
+    строк (для скрытия) и ячейки с плейсхолдерами. Стили, общие строки,
+    тема и связанные части (настройки принтера и т.п.) берутся из
+    шаблона без изменений. Рисунки листа (штампы, линии, подписи)
+    копируются каждому листу акта, изображения рисунков хранятся в книге
+    один раз.
+
+    clone — лист размножается в одной книге: уникальный идентификатор
+    и выбор вкладки из него убираются.
+    '''
+
+    def __init__(self, template_file, sheet_name, clone=True):
+        self.template_file = template_file
+        self.sheet_name = sheet_name
+        self.clone = clone
+        with zipfile.ZipFile(template_file) as zf:
+            self._load(zf)
+
+    def _load(self, zf):
+        workbook = ET.fromstring(zf.read('xl/workbook.xml'))
+        workbook_rels = read_rels(zf, 'xl/workbook.xml')
+
+        sheets = workbook.findall(f'{{{NS_MAIN}}}sheets/{{{NS_MAIN}}}sheet')
+        for sheet_index, sheet in enumerate(sheets):
+            if sheet.get('name') == self.sheet_name:
+                break
+        else:
+            raise KeyError(f"Лист '{self.sheet_name}' не найден "
+                           f"в шаблоне '{self.template_file}'")
+        self.sheet_part = workbook_rels[sheet.get(f'{{{NS_REL}}}id')][1]
+
+        # Области и заголовки печати листа шаблона
+        self.defined_names = []
+        for name in workbook.iter(f'{{{NS_MAIN}}}definedName'):
+            if (name.get('localSheetId') == str(sheet_index)
+                    and name.get('name', '').startswith('_xlnm.')
+                    and name.text and '#' not in name.text):
+                self.defined_names.append((name.get('name'), name.text))
+
+        # Общие части книги
+        self.parts = {}
+        self.shared_strings = []
+        self.shared_strings_part = None
+        self.content_types = self._read_content_types(zf)
+        for rel_type, target in workbook_rels.values():
+            if rel_type in ('styles', 'theme'):
+                self.parts[target] = (rel_type, zf.read(target))
+            elif rel_type == 'sharedStrings':
+                self.shared_strings_part = target
+                self.shared_strings = SHARED_STRING.findall(
+                    zf.read(target).decode('utf-8'))
+
+        root_rels = read_rels(zf, '')
+        self.core = None
+        for rel_type, target in root_rels.values():
+            if rel_type.endswith('core-properties'):
+                self.core = (target, zf.read(target))
+
+        # Связи листа и части, на которые они ссылаются: общие для всех
+        # листов книги (sheet_parts) и собственные части каждого листа
+        # (own_parts: [(имя, данные, связи части или None)])
+        self.sheet_rels = None
+        self.sheet_parts = {}
+        self.own_parts = []
+        if rels_name(self.sheet_part) in zf.namelist():
+            self.sheet_rels = zf.read(
+                rels_name(self.sheet_part)).decode('utf-8')
+            for rel_type, target in read_rels(
+                    zf, self.sheet_part).values():
+                if target is None:
+                    continue
+                if rel_type in SHEET_OWN_PARTS:
+                    rels = rels_name(target)
+                    self.own_parts.append(
+                        (target, zf.read(target),
+                         zf.read(rels) if rels in zf.namelist() else None))
+                    self._read_related_parts(zf, target)
+                else:
+                    self._read_shared_part(zf, target)
+
+        self._compile(zf.read(self.sheet_part).decode('utf-8'))
+
+    def _read_shared_part(self, zf, name):
+        self.sheet_parts[name] = zf.read(name)
+        if rels_name(name) in zf.namelist():
+            self.sheet_parts[rels_name(name)] = zf.read(rels_name(name))
+            self._read_related_parts(zf, name)
+
+    def _read_related_parts(self, zf, source):
+        '''Общие части, на которые ссылается часть source (изображения).'''
+        for rel_type, target in read_rels(zf, source).values():
+            if target is not None and target not in self.sheet_parts:
+                self._read_shared_part(zf, target)
+
+    def sheet_rels_xml(self, index):
+        '''Связи листа index книги актов со ссылками на его копии частей.'''
+        rels = self.sheet_rels
+        for name, _, _ in self.own_parts:
+            file_name = posixpath.basename(name)
+            rels = re.sub(
+                r'(?<=[/"])' + re.escape(file_name) + '"',
+                posixpath.basename(own_part_name(name, index)) + '"', rels)
+        return rels
+
+    def _read_content_types(self, zf):
+        types = ET.fromstring(zf.read('[Content_Types].xml'))
+        defaults, overrides = {}, {}
+        for item in types:
+            if item.tag == f'{{{NS_CT}}}Default':
+                defaults[item.get('Extension').lower()] = \
+                    item.get('ContentType')
+            else:
+                overrides[item.get('PartName').lstrip('/')] = \
+                    item.get('ContentType')
+        return defaults, overrides
+
+    def content_type(self, name):
+        defaults, overrides = self.content_types
+        if name in overrides:
+            return overrides[name]
+        return defaults.get(name.rsplit('.', 1)[-1].lower())
+
+    def _cell_text(self, attrs, body):
+        '''Текст строковой ячейки шаблона или None.'''
+        cell_type = attrs.get('t')
+        if cell_type == 's':
+            match = re.search(r'<v>(\d+)</v>', body)
+            if match:
+                return string_text(self.shared_strings[int(match.group(1))])
+        elif cell_type == 'inlineStr':
+            return string_text(body)
+        elif cell_type == 'str':
+            match = re.search(r'<v>(.*?)</v>', body, re.S)
+            if match:
+                return unescape(match.group(1))
+        return None
+
+    def _compile(self, sheet_xml):
+        if self.clone:
+            # Уникальный идентификатор, кодовое имя листа (VBA) и выбор
+            # вкладки не копируются в клоны: повтор codeName портит книгу
+            sheet_xml = re.sub(
+                r'\s(?:xr:uid|tabSelected|codeName)="[^"]*"', '', sheet_xml)
+        segments = []
+        position = 0
+        for match in SHEET_TOKEN.finditer(sheet_xml):
+            token = match.group(0)
+            slot = None
+            if token.startswith('<row'):
+                attrs = dict(ATTRIBUTE.findall(token))
+                if attrs.get('hidden') not in ('1', 'true'):
+                    slot = XmlRowSlot(int(attrs['r']), token)
+            elif not token.endswith('/>'):
+                head, body = token.split('>', 1)
+                attrs = dict(ATTRIBUTE.findall(head))
+                text = self._cell_text(attrs, body)
+                parts = PLACEHOLDER_PATTERN.split(text) if text else ()
+                if len(parts) > 1:
+                    formula = re.search(r'<f\b.*?(?:</f>|/>)', body, re.S)
+                    row, column = coordinate_to_tuple(attrs['r'])
+                    slot = XmlCellSlot(
+                        CellSlot(row, column, tuple(parts)),
+                        re.sub(r'\st="[^"]*"', '', head),
+                        formula.group(0) if formula else None)
+            if slot is None:
+                continue
+            segments.append(sheet_xml[position:match.start()])
+            segments.append(slot)
+            position = match.end()
+        segments.append(sheet_xml[position:])
+        self.segments = [segment for segment in segments if segment != '']
+
+    def render(self, replacements, hidden_rows, strings):
+        '''XML листа акта в байтах.'''
+        out = []
+        for segment in self.segments:
+            if isinstance(segment, str):
+                out.append(segment)
+            else:
+                out.append(segment.render(replacements, hidden_rows,
+                                          strings))
+        return ''.join(out).encode('utf-8')
+
+
+class ZipFileTemplate:
+    '''Шаблон для записи файлов актов правкой zip-архива шаблона.
+
+    Архив шаблона читается один раз. В файл акта части шаблона
+    копируются в сжатом виде байт в байт, заново пишутся только XML листа
+    акта и общие строки. Рисунки, customXml, настройки принтера и другие
+    части, которые openpyxl не сохраняет, остаются как в шаблоне.
+    '''
+
+    def __init__(self, template_file, sheet_name):
+        self.sheet = XmlSheetTemplate(template_file, sheet_name, clone=False)
+        self.members = read_members(template_file)
+
+    def save_act(self, path, replacements, rows_to_hide,
+                 compression='normal', inline_strings=False):
+        '''Записывает файл акта.
+
+        С inline_strings текст акта пишется в ячейки, и общие строки
+        копируются из шаблона без изменений.
+        '''
+        sheet = self.sheet
+        if sheet.shared_strings_part is None:
+            # В шаблоне нет таблицы общих строк, добавлять её некуда
+            inline_strings = True
+        strings_class = InlineStrings if inline_strings else SharedStrings
+        strings = strings_class(sheet.shared_strings)
+        patched = {
+            sheet.sheet_part: sheet.render(
+                replacements, frozenset(rows_to_hide), strings),
+        }
+        if not inline_strings:
+            patched[sheet.shared_strings_part] = \
+                strings.to_xml().encode('utf-8')
+        write_members(path, [
+            pack_member(member.name, patched[member.name], compression)
+            if member.name in patched else member
+            for member in self.members
+        ])
+
+
+def _sheet_written(callback, strings, member):
+    callback(member, strings)
+
+
+class XmlWorkbookWriter:
+    '''Запись книги актов напрямую в zip без объектной модели openpyxl.
+
+    Листы пишутся в архив по мере создания, общие части (стили, тема,
+    общие строки, описание книги) — один раз при закрытии. С
+    inline_strings текст актов не попадает в общие строки. Листы, уже
+    сжатые в других процессах, добавляются без пересжатия
+    (add_packed_sheet). С queue_depth > 0 части сжимаются и пишутся в
+    отдельном потоке (act_zip.ZipWriterThread), пока строятся следующие
+    листы.
+    '''
+
+    def __init__(self, template, output_path,
+                 compression='normal', previous_path=None,
+                 inline_strings=False, queue_depth=0):
+        self.template = template
+        self.output_path = output_path
+        # Архив пишется во временный файл и заменяет итоговый при закрытии
+        self.tmp_path = temp_path(output_path)
+        self.compression = compression
+        if queue_depth > 0:
+            self.zf = ZipWriterThread(self.tmp_path, queue_depth)
+        else:
+            self.zf = ZipWriter(self.tmp_path)
+        # Сжатые части шаблона, копии которых получает каждый лист
+        self.packed = {}
+        strings_class = InlineStrings if inline_strings else SharedStrings
+        self.strings = strings_class(template.shared_strings)
+        self.sheets = []
+        self.written = {}
+
+        # Прежний файл актов, листы которого переносятся без изменений
+        self.previous = None
+        self.previous_sheets = {}
+        if previous_path is not None:
+            self.previous = zipfile.ZipFile(previous_path)
+            self.previous_sheets = dict(read_sheet_parts(self.previous))
+            # Общие строки прежнего файла включают строки шаблона, поэтому
+            # индексы в перенесённых листах остаются верными
+            sst = self.previous.read('xl/sharedStrings.xml').decode('utf-8')
+            self.strings = strings_class(SHARED_STRING.findall(sst))
+
+    def _write(self, name, data, content_type=None, callback=None):
+        self.zf.add_data(name, data, self.compression, callback)
+        self._written(name, content_type)
+
+    def _add(self, member, content_type=None):
+        self.zf.add(member)
+        self._written(member.name, content_type)
+
+    def _written(self, name, content_type):
+        self.written[name] = (content_type
+                              or self.template.content_type(name))
+
+    def add_sheet(self, title, replacements, hidden_rows=(), callback=None):
+        '''Добавляет лист акта.
+
+        callback(сжатый лист, добавленные общие строки) вызывается после
+        записи листа в архив — с очередью записи в её потоке.
+        '''
+        index = len(self.sheets) + 1
+        name = f'xl/worksheets/sheet{index}.xml'
+        count = len(self.strings.items)
+        data = self.template.render(replacements, frozenset(hidden_rows),
+                                    self.strings)
+        if callback is not None:
+            strings = self.strings.items[count:]
+            callback = functools.partial(_sheet_written, callback, strings)
+        self._write(name, data, CT_SHEET, callback)
+        self._write_sheet_rels(index, name)
+        self.sheets.append(title)
+
+    def add_packed_sheet(self, title, member):
+        '''Добавляет лист акта, уже отрисованный и сжатый (ZipMember).'''
+        index = len(self.sheets) + 1
+        name = f'xl/worksheets/sheet{index}.xml'
+        self._add(member.renamed(name), CT_SHEET)
+        self._write_sheet_rels(index, name)
+        self.sheets.append(title)
+
+    def copy_previous_sheet(self, title):
+        '''Переносит лист акта из прежнего файла без изменений.'''
+        index = len(self.sheets) + 1
+        name = f'xl/worksheets/sheet{index}.xml'
+        self._write(name, self.previous.read(self.previous_sheets[title]),
+                    CT_SHEET)
+        self._write_sheet_rels(index, name)
+        self.sheets.append(title)
+
+    def _write_sheet_rels(self, index, name):
+        '''Связи листа index и копии его собственных частей (рисунков).'''
+        template = self.template
+        if template.sheet_rels is None:
+            return
+        self._write(rels_name(name), template.sheet_rels_xml(index), CT_RELS)
+        for part, data, rels in template.own_parts:
+            own_name = own_part_name(part, index)
+            # Тип содержимого копии — как у части шаблона
+            self._add(self._packed(part, data).renamed(own_name),
+                      template.content_type(part))
+            if rels is not None:
+                # Ссылки относительные, копия лежит в той же папке
+                self._add(self._packed(rels_name(part), rels).renamed(
+                    rels_name(own_name)), CT_RELS)
+
+    def _packed(self, name, data):
+        '''Часть шаблона, сжатая один раз для всех листов.'''
+        member = self.packed.get(name)
+        if member is None:
+            member = self.packed[name] = pack_member(name, data,
+                                                     self.compression)
+        return member
+
+    def close(self):
+        '''Дописывает общие части книги и заменяет итоговый файл.'''
+        template = self.template
+        try:
+            for name, data in template.sheet_parts.items():
+                self._write(name, data)
+
+            workbook_rels = []
+            for index in range(1, len(self.sheets) + 1):
+                workbook_rels.append(
+                    (f'rId{index}', 'worksheet',
+                     f'worksheets/sheet{index}.xml'))
+            for name, (rel_type, data) in template.parts.items():
+                self._write(name, data)
+                workbook_rels.append((f'rId{len(workbook_rels) + 1}',
+                                      rel_type, name[len('xl/'):]))
+            self._write('xl/sharedStrings.xml', self.strings.to_xml(),
+                        CT_SHARED_STRINGS)
+            workbook_rels.append((f'rId{len(workbook_rels) + 1}',
+                                  'sharedStrings', 'sharedStrings.xml'))
+
+            self._write('xl/workbook.xml', self._workbook_xml(), CT_WORKBOOK)
+            self._write('xl/_rels/workbook.xml.rels',
+                        self._rels_xml(workbook_rels), CT_RELS)
+
+            root_rels = [('rId1', 'officeDocument', 'xl/workbook.xml')]
+            if template.core is not None:
+                name, data = template.core
+                self._write(name, data, CT_CORE)
+                root_rels.append(
+                    ('rId2', None, name,
+                     'http://schemas.openxmlformats.org/package/2006/'
+                     'relationships/metadata/core-properties'))
+            self._write('_rels/.rels', self._rels_xml(root_rels), CT_RELS)
+
+            self.zf.add(pack_member('[Content_Types].xml',
+                                    self._content_types_xml(),
+                                    self.compression))
+            self.zf.close()
+        except BaseException:
+            self.abort()
+            raise
+        self._close_previous()
+        os.replace(self.tmp_path, self.output_path)
+
+    def abort(self):
+        '''Прерывает запись: временный файл удаляется, итоговый не меняется.'''
+        self.zf.abort()
+        self._close_previous()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def _close_previous(self):
+        if self.previous is not None:
+            self.previous.close()
+
+    def _workbook_xml(self):
+        sheets = []
+        names = []
+        template_sheet = quote_sheet_name(self.template.sheet_name) + '!'
+        for index, title in enumerate(self.sheets):
+            sheets.append(f'<sheet name={quoteattr(title)} '
+                          f'sheetId="{index + 1}" r:id="rId{index + 1}"/>')
+            for name, value in self.template.defined_names:
+                value = value.replace(template_sheet,
+                                      quote_sheet_name(title) + '!')
+                names.append(f'<definedName name="{name}" '
+                             f'localSheetId="{index}">'
+                             f'{escape(value)}</definedName>')
+        defined_names = (f'<definedNames>{"".join(names)}</definedNames>'
+                         if names else '')
+        return (f'{XML_HEADER}<workbook xmlns="{NS_MAIN}" '
+                f'xmlns:r="{NS_REL}"><workbookPr/><bookViews>'
+                f'<workbookView activeTab="0"/></bookViews>'
+                f'<sheets>{"".join(sheets)}</sheets>{defined_names}'
+                f'<calcPr calcId="191029" fullCalcOnLoad="1"/></workbook>')
+
+    def _rels_xml(self, rels):
+        items = []
+        for rel in rels:
+            rel_id, rel_type, target = rel[:3]
+            full_type = rel[3] if len(rel) > 3 else REL_TYPE + rel_type
+            items.append(f'<Relationship Id="{rel_id}" Type="{full_type}" '
+                         f'Target={quoteattr(target)}/>')
+        return (f'{XML_HEADER}<Relationships xmlns="{NS_PKG_REL}">'
+                + ''.join(items) + '</Relationships>')
+
+    def _content_types_xml(self):
+        defaults, _ = self.template.content_types
+        defaults = dict(defaults)
+        defaults.setdefault('rels', CT_RELS)
+        defaults.setdefault('xml', 'application/xml')
+        items = [f'<Default Extension="{ext}" ContentType="{content_type}"/>'
+                 for ext, content_type in defaults.items()]
+        for name, content_type in self.written.items():
+            ext = name.rsplit('.', 1)[-1].lower()
+            if content_type and defaults.get(ext) != content_type:
+                items.append(f'<Override PartName="/{name}" '
+                             f'ContentType="{content_type}"/>')
+        return (f'{XML_HEADER}<Types xmlns="{NS_CT}">'
+                + ''.join(items) + '</Types>')
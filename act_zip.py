@@ -0,0 +1,267 @@
+import queue
+import struct
+import threading
+import time
+import zipfile
+import zlib
+
+
+# Сжатие zip при записи книг: имя -> (метод, уровень)
+COMPRESSION_LEVELS = {
+    'store': (zipfile.ZIP_STORED, None),    # Без сжатия, быстрее всего
+    'fast': (zipfile.ZIP_DEFLATED, 1),
+    'normal': (zipfile.ZIP_DEFLATED, 6),    # Как у openpyxl и Excel
+    'max': (zipfile.ZIP_DEFLATED, 9),       # Для архива
+}
+
+# Заголовки zip: локальный заголовок части, запись центрального каталога
+# и конец каталога
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+END_RECORD = struct.Struct('<IHHHHIIH')
+LOCAL_SIGNATURE = 0x04034b50
+CENTRAL_SIGNATURE = 0x02014b50
+END_SIGNATURE = 0x06054b50
+
+# Zip64: смещение части в дополнительном поле записи каталога, конец
+# каталога zip64 и его указатель. Нужны, когда в общем файле актов больше
+# 65535 частей или он больше 4 ГБ
+ZIP64_EXTRA = struct.Struct('<HHQ')
+ZIP64_END_RECORD = struct.Struct('<IQHHIIQQQQ')
+ZIP64_LOCATOR = struct.Struct('<IIQI')
+ZIP64_END_SIGNATURE = 0x06064b50
+ZIP64_LOCATOR_SIGNATURE = 0x07064b50
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+
+# Версия формата, нужная для распаковки: 2.0 (deflate), 4.5 (zip64)
+ZIP_VERSION = 20
+ZIP64_VERSION = 45
+
+# Буфер записи архива: на сетевом диске каждая запись в файл платит
+# задержку сети, поэтому части копятся в памяти и пишутся крупно
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Флаги части: размеры в дескрипторе после данных, имя в UTF-8
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+
+def open_zip(path, compression='normal'):
+    '''Zip-архив для записи книги с уровнем сжатия из COMPRESSION_LEVELS.'''
+    method, level = COMPRESSION_LEVELS[compression]
+    return zipfile.ZipFile(path, 'w', method, allowZip64=True,
+                           compresslevel=level)
+
+
+def dos_datetime(date_time):
+    '''Время и дата в формате MS-DOS для заголовков zip.'''
+    year, month, day, hour, minute, second = date_time[:6]
+    return (hour << 11 | minute << 5 | second // 2,
+            (year - 1980) << 9 | month << 5 | day)
+
+
+class ZipMember:
+    '''Часть архива в сжатом виде, готовая к записи без пересжатия.'''
+
+    __slots__ = ('name', 'flags', 'method', 'dos_time', 'dos_date', 'crc',
+                 'size', 'data', 'external_attr')
+
+    def __init__(self, name, method, dos_time, dos_date, crc, size, data,
+                 flags=0, external_attr=0):
+        self.name = name
+        # Размеры и CRC пишутся в локальный заголовок, дескриптор не нужен
+        flags &= ~(FLAG_DATA_DESCRIPTOR | FLAG_UTF8)
+        if not name.isascii():
+            flags |= FLAG_UTF8
+        self.flags = flags
+        self.method = method
+        self.dos_time = dos_time
+        self.dos_date = dos_date
+        self.crc = crc
+        self.size = size
+        self.data = data
+        self.external_attr = external_attr
+
+    def renamed(self, name):
+        '''Та же часть под другим именем, данные не копируются.'''
+        return ZipMember(name, self.method, self.dos_time, self.dos_date,
+                         self.crc, self.size, self.data, self.flags,
+                         self.external_attr)
+
+
+def read_members(path):
+    '''Части zip-архива в исходном порядке, без распаковки.'''
+    members = []
+    with open(path, 'rb') as f, zipfile.ZipFile(f) as zf:
+        for info in zf.infolist():
+            f.seek(info.header_offset)
+            header = LOCAL_HEADER.unpack(f.read(LOCAL_HEADER.size))
+            name_length, extra_length = header[-2:]
+            f.seek(info.header_offset + LOCAL_HEADER.size
+                   + name_length + extra_length)
+            members.append(ZipMember(
+                info.filename, info.compress_type,
+                *dos_datetime(info.date_time), info.CRC, info.file_size,
+                f.read(info.compress_size), info.flag_bits,
+                info.external_attr))
+    return members
+
+
+def pack_member(name, data, compression='normal'):
+    '''Новая часть архива: данные сжимаются с уровнем из COMPRESSION_LEVELS.'''
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    method, level = COMPRESSION_LEVELS[compression]
+    packed = data
+    if method == zipfile.ZIP_DEFLATED:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        packed = compressor.compress(data) + compressor.flush()
+    return ZipMember(name, method, *dos_datetime(time.localtime()),
+                     zlib.crc32(data), len(data), packed)
+
+
+class ZipWriter:
+    '''Последовательная запись zip-архива из готовых сжатых частей.
+
+    Части пишутся в файл сразу, в памяти остаётся только центральный
+    каталог. Отдельная часть не может быть больше 4 ГБ.
+    '''
+
+    def __init__(self, path):
+        self.f = open(path, 'wb', buffering=WRITE_BUFFER_SIZE)
+        self.offset = 0
+        self.directory = []
+
+    def add(self, member):
+        name = member.name.encode('utf-8')
+        fields = (member.flags, member.method, member.dos_time,
+                  member.dos_date, member.crc, len(member.data),
+                  member.size, len(name))
+        header = LOCAL_HEADER.pack(LOCAL_SIGNATURE, ZIP_VERSION, *fields, 0)
+        self.f.write(header)
+        self.f.write(name)
+        self.f.write(member.data)
+
+        offset, extra, version = self.offset, b'', ZIP_VERSION
+        if offset >= ZIP64_LIMIT:
+            extra = ZIP64_EXTRA.pack(1, 8, offset)
+            offset, version = ZIP64_LIMIT, ZIP64_VERSION
+        self.directory.append(
+            CENTRAL_HEADER.pack(CENTRAL_SIGNATURE, version, version,
+                                *fields, len(extra), 0, 0, 0,
+                                member.external_attr, offset)
+            + name + extra)
+        self.offset += len(header) + len(name) + len(member.data)
+
+    def close(self):
+        '''Дописывает центральный каталог и закрывает файл.'''
+        try:
+            directory = b''.join(self.directory)
+            count = len(self.directory)
+            start = self.offset
+            if (count >= ZIP64_COUNT_LIMIT or start >= ZIP64_LIMIT
+                    or len(directory) >= ZIP64_LIMIT):
+                end = start + len(directory)
+                directory += ZIP64_END_RECORD.pack(
+                    ZIP64_END_SIGNATURE, ZIP64_END_RECORD.size - 12,
+                    ZIP64_VERSION, ZIP64_VERSION, 0, 0, count, count,
+                    len(directory), start)
+                directory += ZIP64_LOCATOR.pack(ZIP64_LOCATOR_SIGNATURE,
+                                                0, end, 1)
+                size = min(end - start, ZIP64_LIMIT)
+                count = min(count, ZIP64_COUNT_LIMIT)
+                start = min(start, ZIP64_LIMIT)
+            else:
+                size = len(directory)
+            self.f.write(directory)
+            self.f.write(END_RECORD.pack(END_SIGNATURE, 0, 0, count, count,
+                                         size, start, 0))
+        finally:
+            self.f.close()
+
+    def add_data(self, name, data, compression='normal', callback=None):
+        '''Сжимает и записывает часть; callback(часть) — после записи.'''
+        member = pack_member(name, data, compression)
+        self.add(member)
+        if callback is not None:
+            callback(member)
+
+    def abort(self):
+        '''Закрывает файл без каталога: архив остаётся неполным.'''
+        self.f.close()
+
+
+class ZipWriterThread:
+    '''ZipWriter, который сжимает и пишет части в отдельном потоке.
+
+    Части ставятся в очередь глубиной depth, и вызывающий готовит
+    следующие, пока поток записи сжимает и пишет предыдущие: сжатие
+    и запись на диск (в том числе сетевой) идут параллельно с
+    построением листов. При полной очереди add ждёт. Ошибка записи
+    передаётся вызывающему при следующем add или при close.
+    '''
+
+    def __init__(self, path, depth=16):
+        self.writer = ZipWriter(path)
+        self.queue = queue.Queue(maxsize=max(depth, 1))
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def add(self, member, callback=None):
+        self._put((member, callback))
+
+    def add_data(self, name, data, compression='normal', callback=None):
+        self._put(((name, data, compression), callback))
+
+    def _put(self, item):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(item)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                # После ошибки очередь только разбирается
+                continue
+            member, callback = item
+            try:
+                if isinstance(member, tuple):
+                    member = pack_member(*member)
+                self.writer.add(member)
+                if callback is not None:
+                    callback(member)
+            except BaseException as e:
+                self.error = e
+
+    def _stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def close(self):
+        '''Дожидается записи всех частей и дописывает каталог.'''
+        self._stop()
+        if self.error is not None:
+            self.writer.abort()
+            raise self.error
+        self.writer.close()
+
+    def abort(self):
+        self._stop()
+        self.writer.abort()
+
+
+def write_members(path, members):
+    '''Записывает zip-архив из готовых сжатых частей.'''
+    writer = ZipWriter(path)
+    try:
+        for member in members:
+            writer.add(member)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
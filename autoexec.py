@@ -1,9 +1,34 @@
 from openpyxl import load_workbook, Workbook
-from datetime import date, datetime
+import argparse
+import cProfile
+import functools
+import itertools
 import os
 import logging
+import pstats
 import sys
-from copy import copy
+import tracemalloc
+
+from act_cache import (CACHE_FOLDER, load_template_plan,
+                       load_template_workbook, load_xml_template)
+from act_data import parse_rows, select_rows
+from act_documents import (DOCUMENT_TYPES, act_sheet_title, build_act,
+                           unique_acts)
+from act_files import (SAVE_THREADS, generate_act_files, queue_limit,
+                       render_sheets)
+import act_metrics
+from act_metrics import ActProgress, format_size, stage
+from act_plan import plan_acts, template_placeholders, write_plan
+from act_snapshot import open_data
+from act_journal import (ActJournal, journal_member, journal_path,
+                         resume_prefix)
+from act_manifest import (GENERATOR_VERSION, Manifest, file_hash,
+                          manifest_path, plan_incremental, record_hash,
+                          remove_stale_temp)
+from act_template import SheetCloner, SheetLayout, compile_template
+from act_watch import WATCH_INTERVAL, FileWatcher
+from act_xml import XmlWorkbookWriter, save_workbook
+from act_zip import COMPRESSION_LEVELS
 
 
 def setup_logging():
@@ -18,12 +43,6 @@ def setup_logging():
     )
 
 
-def format_date(val):
-    '''Функция для формата ячеек с датами.'''
-    return (val.strftime('%d.%m.%Y') if isinstance(val, date)
-            else str(val or ''))
-
-
 def validate_files(data_file, template_file):
     '''Проверка существования необходимых файлов.'''
     if not os.path.exists(data_file):
@@ -33,20 +52,6 @@ def validate_files(data_file, template_file):
     logging.info(f"Файлы проверены: {data_file}, {template_file}")
 
 
-def get_act_date(*dates):
-    '''Упрощенная функция для определения даты акта.'''
-    valid_dates = []
-    for dt in dates:
-        if dt:
-            if isinstance(dt, datetime):
-                valid_dates.append(dt.date())
-            elif isinstance(dt, date):
-                valid_dates.append(dt)
-    if valid_dates:
-        return max(valid_dates).strftime('%d.%m.%Y')
-    return date.today().strftime('%d.%m.%Y')
-
-
 def copy_print_settings(source_ws, target_ws):
     '''Копирует настройки печати из исходного листа в целевой.'''
     try:
@@ -116,247 +121,765 @@ def copy_print_settings(source_ws, target_ws):
 
         msg = f"Настройки печати, представления и центрирования " \
               f"скопированы для листа '{target_ws.title}'"
-        logging.info(msg)
+        logging.debug(msg)
 
     except Exception as e:
         logging.warning(f"Ошибка при копировании настроек печати: {e}")
         # Продолжаем выполнение, даже если настройки печати не скопировать
 
 
-def copy_worksheet(source_ws, target_wb, sheet_name):
-    '''Копирует лист с сохранением форматирования и настроек печати.'''
-    target_ws = target_wb.create_sheet(title=sheet_name)
-
-    # Копируем все ячейки
-    for row in source_ws:
-        for cell in row:
-            target_cell = target_ws[cell.coordinate]
-            target_cell.value = cell.value
-
-            # Копируем форматирование
-            if cell.has_style:
-                target_cell.font = copy(cell.font)
-                target_cell.border = copy(cell.border)
-                target_cell.fill = copy(cell.fill)
-                target_cell.number_format = cell.number_format
-                target_cell.protection = copy(cell.protection)
-                target_cell.alignment = copy(cell.alignment)
+def copy_worksheet(source_ws, target_wb, sheet_name, cloner=None):
+    '''Копирует лист с сохранением форматирования и настроек печати.
 
-    # Копируем размеры строк и столбцов
-    for row_num, row_dimension in source_ws.row_dimensions.items():
-        target_ws.row_dimensions[row_num].height = row_dimension.height
-        target_ws.row_dimensions[row_num].hidden = row_dimension.hidden
+    Для многократного копирования одного шаблона передайте заранее
+    созданный SheetCloner, чтобы разбирать шаблон только один раз.
+    '''
+    with stage('copy_worksheet'):
+        if cloner is None:
+            cloner = SheetCloner(source_ws, target_wb)
+        target_ws = cloner.clone(sheet_name)
 
-    for col_letter, col_dimension in source_ws.column_dimensions.items():
-        target_ws.column_dimensions[col_letter].width = col_dimension.width
-        target_ws.column_dimensions[col_letter].hidden = col_dimension.hidden
-
-    # Копируем объединенные ячейки
-    for merged_range in source_ws.merged_cells.ranges:
-        target_ws.merge_cells(str(merged_range))
-
-    # Копируем настройки печати
-    copy_print_settings(source_ws, target_ws)
+        # Копируем настройки печати
+        with stage('copy_print_settings'):
+            copy_print_settings(source_ws, target_ws)
 
     return target_ws
 
 
-def main():
+def parse_args(argv=None):
+    '''Разбор параметров командной строки.'''
+    parser = argparse.ArgumentParser(
+        description='Формирование актов АОСР по книге данных')
+    parser.add_argument(
+        '--data', default='я. Бетон (Июль).xlsx',
+        help='книга с данными для актов или её снимок SQLite')
+    parser.add_argument(
+        '--output-dir', default='',
+        help='папка, в которой создаются папки актов (по умолчанию текущая)')
+    parser.add_argument(
+        '--documents', nargs='+', choices=sorted(DOCUMENT_TYPES),
+        default=['beton'],
+        help='виды документов, которые нужно сформировать')
+    parser.add_argument(
+        '--rows', type=parse_rows,
+        help='только строки листа данных из списка, например 5-20,31')
+    parser.add_argument(
+        '--all', action='store_true',
+        help='сформировать все виды документов за один проход')
+    parser.add_argument(
+        '--engine', choices=('openpyxl', 'xml', 'stream'),
+        default='openpyxl',
+        help='openpyxl — листы через объектную модель openpyxl; '
+             'xml — прямая запись XML листов шаблона в итоговый файл; '
+             'stream — как xml, но текст актов пишется в ячейки, а не '
+             'в общие строки: память не растёт с числом актов. '
+             'С xml и stream отдельные файлы актов получаются правкой '
+             'zip-архива шаблона: рисунки и прочие части сохраняются')
+    parser.add_argument(
+        '--compression', choices=list(COMPRESSION_LEVELS), default='normal',
+        help='сжатие выходных файлов: store — без сжатия (быстрее), '
+             'fast, normal, max — наименьший размер для архива')
+    parser.add_argument(
+        '--max-sheets', type=int, default=0,
+        help='не более N листов в общем файле: акты раскладываются по '
+             'файлам _001, _002, … с оглавлением (0 — один файл)')
+    parser.add_argument(
+        '--no-cache', dest='cache_folder', action='store_const',
+        const=None, default=CACHE_FOLDER,
+        help=f'не использовать кеш разобранных шаблонов и снимков '
+             f'книги данных (папка {CACHE_FOLDER})')
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help='пересобрать только акты с изменившимися строками данных')
+    parser.add_argument(
+        '--resume', action='store_true',
+        help='продолжить прерванный запуск по журналу готовых актов: '
+             'акты, уже записанные в журнал, не формируются заново')
+    parser.add_argument(
+        '--jobs', type=int, default=1,
+        help='число процессов для записи файлов актов и, с движками xml '
+             'и stream, для подготовки листов общего файла '
+             '(0 — по числу ядер)')
+    parser.add_argument(
+        '--queue-depth', type=int, default=0,
+        help='сколько актов может ждать между построением, сжатием и '
+             'записью; построение не ждёт записи, пока очередь не '
+             'заполнена (0 — по числу процессов или потоков)')
+    parser.add_argument(
+        '--report', default='autoexec_report.json',
+        help='файл отчёта о запуске: время и вызовы этапов (JSON)')
+    parser.add_argument(
+        '--trace-memory', action='store_true',
+        help='замерять пик памяти этапов через tracemalloc (медленнее)')
+    parser.add_argument(
+        '--profile', metavar='FILE',
+        help='выполнить запуск под cProfile и сохранить статистику в FILE')
+    parser.add_argument(
+        '--plan', metavar='FILE',
+        help='не создавать акты, а записать план: значения плейсхолдеров, '
+             'скрываемые строки и предупреждения по каждой строке данных '
+             '(FILE.json, FILE.csv или - для вывода на экран)')
+    parser.add_argument(
+        '--watch', action='store_true',
+        help='следить за книгой данных и шаблонами и пересобирать '
+             'изменившиеся акты после каждого сохранения')
+    parser.add_argument(
+        '--interval', type=float, default=WATCH_INTERVAL,
+        help='период опроса файлов в режиме наблюдения, секунды')
+    args = parser.parse_args(argv)
+    if args.watch:
+        # Между сохранениями пересобираются только изменившиеся акты
+        args.incremental = True
+    if args.incremental and args.max_sheets:
+        parser.error('--incremental нельзя совмещать с --max-sheets')
+    if args.incremental and args.rows:
+        # Акты строк вне фильтра считались бы удалёнными
+        parser.error('--incremental нельзя совмещать с --rows')
+    if args.resume and (args.incremental or args.max_sheets):
+        parser.error('--resume нельзя совмещать с --incremental и '
+                     '--max-sheets')
+    if args.all:
+        args.documents = list(DOCUMENT_TYPES)
+    args.jobs = args.jobs or os.cpu_count()
+    return args
+
+
+def generate_document(document, records, engine='openpyxl', jobs=1,
+                      incremental=False, max_sheets=0,
+                      cache_folder=CACHE_FOLDER, total=None,
+                      compression='normal', resume=False, queue_depth=0):
+    '''Формирует акты одного вида документа из записей данных.
+
+    В инкрементальном режиме пересобираются только акты, строки данных
+    которых изменились с прошлого запуска (по манифесту рядом с папкой
+    актов), акты удалённых строк удаляются, остальные переиспользуются.
+    total — ожидаемое число актов для оценки оставшегося времени.
+    Готовые акты записываются в журнал (act_journal); с resume запуск
+    продолжается с места, на котором прервался прежний. queue_depth —
+    глубина очередей между построением, сжатием и записью актов.
+    Возвращает {id акта строкой: файл акта или «файл!лист»}.
+    '''
+    # Номер акта — имя его листа или файла, повторы пропускаются
+    records = unique_acts(records)
+
+    # Создаем папку для выходных файлов
+    os.makedirs(document.output_folder, exist_ok=True)
+    logging.info(f"Создана/проверена папка: {document.output_folder}")
+    # Недописанные файлы упавших запусков: в папке актов, а также журнал
+    # и манифест рядом с ней
+    remove_stale_temp(document.output_folder)
+    folder = os.path.normpath(document.output_folder)
+    remove_stale_temp(os.path.dirname(folder) or '.',
+                      os.path.basename(folder))
+
+    output_path = None
+    if document.output_file:
+        output_path = os.path.join(document.output_folder,
+                                   document.output_file)
+
+    reuse = frozenset()
+    if incremental:
+        template_hash = file_hash(document.template_file)
+        if output_path is not None:
+            # Листы общего файла переносятся как есть, поэтому прежний
+            # файл пригоден, только если он записан тем же движком
+            template_hash += f':{engine}'
+        manifest_file = manifest_path(document.output_folder)
+        previous = Manifest.load(manifest_file)
+        if output_path is None:
+            exists = os.path.exists
+        else:
+            output_exists = os.path.exists(output_path)
+
+            def exists(output):
+                return output_exists
+        records, hashes, reuse, removed = plan_incremental(
+            records, previous, template_hash, exists)
+        logging.info(f"Инкрементальный режим: без изменений {len(reuse)}, "
+                     f"к пересборке {len(records) - len(reuse)}, "
+                     f"удалено {len(removed)}")
+        total = len(records) - len(reuse)
+        if output_path is None:
+            for path in removed.values():
+                if os.path.exists(path):
+                    os.remove(path)
+                    logging.info(f"Удален файл '{path}'")
+        elif (not total and previous is not None
+              and list(previous.acts) == list(hashes)):
+            # Общий файл уже содержит все акты в нужном порядке
+            logging.info(f"Файл '{output_path}' не изменился")
+            return {id: f"{output_path}!{act['output']}"
+                    for id, act in previous.acts.items()}
+
+    progress = ActProgress(document.title, total,
+                           'листов' if output_path else 'файлов')
+    journal = open_journal(document, output_path, engine, jobs,
+                           compression, resume, incremental or max_sheets)
+
+    if output_path is not None and max_sheets:
+        return process_acts_sharded(records, document, output_path, engine,
+                                    max_sheets, cache_folder, progress,
+                                    compression)
+
+    if output_path is None:
+        outputs = generate_act_files(
+            [record for record in records if record.id not in reuse],
+            document, jobs, cache_folder, progress, compression, engine,
+            journal, resume, queue_depth)
+        if reuse:
+            outputs = {
+                **{id: previous.acts[id]['output'] for id in map(str, reuse)},
+                **outputs}
+    elif engine != 'openpyxl':
+        with stage('template_load'):
+            xml_template = load_xml_template(document.template_file,
+                                             document.template_sheet,
+                                             cache_folder)
+        logging.info(f"Загружен файл шаблона: {document.template_file}")
+
+        outputs = process_acts_xml(records, xml_template, output_path,
+                                   document, reuse, progress,
+                                   inline_strings=engine == 'stream',
+                                   compression=compression, jobs=jobs,
+                                   cache_folder=cache_folder,
+                                   journal=journal, resume=resume,
+                                   queue_depth=queue_depth)
+    else:
+        # Загружаем шаблон
+        with stage('template_load'):
+            wb_template = load_template_workbook(document.template_file,
+                                                 cache_folder)
+            template_plan = load_template_plan(document.template_file,
+                                               document.template_sheet,
+                                               cache_folder)
+        ws_template = wb_template[document.template_sheet]
+        logging.info(f"Загружен файл шаблона: {document.template_file}")
+
+        if reuse:
+            # Прежний файл актов: остаются только неизменившиеся листы
+            with stage('previous_load'):
+                output_wb = load_workbook(output_path)
+            keep = {act_sheet_title(id) for id in reuse}
+            for ws in list(output_wb.worksheets):
+                if ws.title not in keep:
+                    output_wb.remove(ws)
+        else:
+            # Создаем новую книгу для всех актов
+            output_wb = new_output_workbook()
+
+        outputs = process_acts(records, ws_template, output_wb, output_path,
+                               document, reuse, progress, compression,
+                               template_plan)
+
+        # Закрываем исходный файл шаблона
+        wb_template.close()
+
+    if incremental:
+        acts = {id: {'hash': hashes[id], 'output': output}
+                for id, output in outputs.items()}
+        Manifest(template_hash, acts).save(manifest_file)
+
+    if output_path is None:
+        return outputs
+    return {id: f'{output_path}!{sheet_name}'
+            for id, sheet_name in outputs.items()}
+
+
+def open_journal(document, output_path, engine, jobs, compression,
+                 resume=False, disabled=False):
+    '''Журнал готовых актов запуска или None.
+
+    Журнал ведётся для файлов актов и для общего файла движков xml и
+    stream, листы которых уже сжаты и пригодны для переноса. Прежний
+    журнал без resume перезаписывается.
+    '''
+    if disabled:
+        return None
+    if output_path is not None and engine == 'openpyxl':
+        if resume:
+            logging.warning("С движком openpyxl общий файл не "
+                            "журналируется и формируется заново; для "
+                            "продолжения запусков используйте --engine xml")
+        return None
+    inline_strings = engine == 'stream' or (output_path is not None
+                                            and jobs > 1)
+    key = (f"{GENERATOR_VERSION}:{file_hash(document.template_file)}:"
+           f"{engine}:{compression}:{'inline' if inline_strings else 's'}")
+    journal = ActJournal(journal_path(output_path or document.output_folder),
+                         key)
+    if not resume and os.path.exists(journal.path):
+        logging.warning(f"Журнал прерванного запуска '{journal.path}' "
+                        f"будет перезаписан; чтобы продолжить его, "
+                        f"запустите с --resume")
+    return journal
+
+
+def main(argv=None):
     '''Основная функция выполнения программы.'''
+    args = parse_args(argv)
     setup_logging()
 
-    data_file = 'я. Бетон (Июль).xlsx'  # Путь к файлу с данными
-    template_file = 'Шаблон.xlsx'  # Путь к шаблону для актов
-    output_folder = 'Акты_бетон'  # Название для папки под акты
-    output_file = 'Все_акты_бетон.xlsx'  # Итоговый файл с всеми актами
+    documents = select_documents(args)
 
-    try:
-        # Проверка существования файлов
-        validate_files(data_file, template_file)
+    if args.plan:
+        if not plan(args, documents):
+            sys.exit(1)
+    elif args.watch:
+        watch(args, documents)
+    elif not run(args, documents):
+        sys.exit(1)
 
-        # Создаем папку для выходных файлов
-        os.makedirs(output_folder, exist_ok=True)
-        logging.info(f"Создана/проверена папка: {output_folder}")
 
-        # Загрузка файлов
-        wb_data = load_workbook(data_file)
-        ws_data = wb_data['Бетон для АОСР']
-        logging.info(f"Загружен файл данных: {data_file}")
+def select_documents(args):
+    '''Виды документов запуска с папками актов внутри args.output_dir.'''
+    return [
+        DOCUMENT_TYPES[key]._replace(output_folder=os.path.join(
+            args.output_dir, DOCUMENT_TYPES[key].output_folder))
+        for key in args.documents
+    ]
 
-        # Загружаем шаблон
-        wb_template = load_workbook(template_file)
-        ws_template = wb_template['АОСР бетон']
-        logging.info(f"Загружен файл шаблона: {template_file}")
 
-        # Создаем новую книгу для всех актов
-        output_wb = Workbook()
-        # Удаляем стандартный лист
-        if output_wb.active:
-            output_wb.remove(output_wb.active)
+def plan(args, documents):
+    '''Проверка книги данных без записи актов.
 
-        output_path = os.path.join(output_folder, output_file)
+    План актов записывается в args.plan, предупреждения и ошибки — в
+    журнал. Возвращает False, если хотя бы один акт не сформируется.
+    '''
+    entries = []
+    try:
+        for document in documents:
+            validate_files(args.data, document.template_file)
+        data = open_data(args.data,
+                         [document.data_sheet for document in documents],
+                         args.cache_folder)
+        try:
+            for document in documents:
+                wb_template = load_template_workbook(document.template_file,
+                                                     args.cache_folder)
+                placeholders = template_placeholders(
+                    wb_template[document.template_sheet])
+                records = data.sheet_records(document.data_sheet)
+                entries += plan_acts(document, records, placeholders)
+        finally:
+            data.close()
+        write_plan(entries, args.plan)
+    except Exception as e:
+        logging.error(f"Ошибка: {e}")
+        print(f"Ошибка: {e}")
+        return False
+
+    errors = 0
+    warnings = 0
+    for entry in entries:
+        where = (f"{entry['document']}, акт №{entry['id']} "
+                 f"(строка {entry['row']})")
+        for warning in entry['warnings']:
+            warnings += 1
+            logging.warning(f"{where}: {warning}")
+        if entry['error']:
+            errors += 1
+            logging.error(f"{where}: {entry['error']}")
+    logging.info(f"План записан: {args.plan}. Актов: {len(entries)}, "
+                 f"предупреждений: {warnings}, ошибок: {errors}")
+    return not errors
+
+
+def run(args, documents, outputs=None):
+    '''Один проход генерации актов. Возвращает True при успехе.
+
+    В словарь outputs, если он передан, записываются созданные акты:
+    {вид документа: {id акта: файл акта или «файл!лист»}}.
+    '''
+    metrics = act_metrics.reset_metrics()
+    if args.trace_memory:
+        tracemalloc.start()
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
 
-        process_acts(ws_data, ws_template, output_wb, output_path)
+    try:
+        # Проверка существования файлов
+        for document in documents:
+            validate_files(args.data, document.template_file)
+
+        # Книга данных открывается один раз для всех видов документов,
+        # листы читаются потоково по мере генерации. Разобранные листы
+        # хранятся в снимке и при неизменной книге читаются из него
+        with stage('data_open'):
+            data = open_data(args.data,
+                             [document.data_sheet for document in documents],
+                             args.cache_folder)
+        logging.info(f"Открыт файл данных: {args.data}")
 
-        # Закрываем исходные файлы
-        wb_data.close()
-        wb_template.close()
+        try:
+            for document in documents:
+                logging.info(f"Формирование актов на {document.title}")
+                total = data.count_records(document.data_sheet)
+                records = data.sheet_records(document.data_sheet)
+                if args.rows:
+                    records = select_rows(records, args.rows)
+                    total = None
+                records = metrics.timed_iter('data_read', records)
+                created = generate_document(
+                    document, records, args.engine, args.jobs,
+                    args.incremental, args.max_sheets, args.cache_folder,
+                    total, args.compression, args.resume,
+                    args.queue_depth)
+                if outputs is not None:
+                    outputs[document.key] = created
+        finally:
+            # Закрываем исходный файл данных
+            data.close()
 
     except FileNotFoundError as e:
         logging.error(f"Ошибка: {e}")
         print(f"Ошибка: {e}")
-        sys.exit(1)
+        return False
     except Exception as e:
         logging.error(f"Неожиданная ошибка: {e}")
         print(f"Неожиданная ошибка: {e}")
-        sys.exit(1)
-
+        return False
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+            logging.info(f"Профиль сохранен: {args.profile}")
+        write_run_report(metrics, args.report)
+        if args.trace_memory:
+            tracemalloc.stop()
+    return True
+
+
+def watch(args, documents):
+    '''Режим наблюдения: пересборка актов при сохранении файлов.
+
+    Книга данных и шаблоны опрашиваются раз в args.interval секунд.
+    После сохранения файла пересобираются только акты изменившихся строк
+    (инкрементальный режим), разобранные шаблоны остаются в памяти
+    процесса между проходами.
+    '''
+    paths = [args.data] + sorted({document.template_file
+                                  for document in documents})
+    watcher = FileWatcher(paths)
+    run(args, documents)
+    logging.info(f"Наблюдение за файлами: {', '.join(paths)}. "
+                 f"Для выхода нажмите Ctrl+C")
+    try:
+        while True:
+            changed = watcher.wait(args.interval)
+            logging.info(f"Изменены файлы: {', '.join(changed)}")
+            run(args, documents)
+    except KeyboardInterrupt:
+        logging.info("Наблюдение остановлено")
+
+
+def write_run_report(metrics, report_path):
+    '''Сохраняет отчёт о запуске и пишет сводку этапов в журнал.'''
+    report = metrics.report()
+    stages = sorted(report['stages'].items(),
+                    key=lambda item: item[1]['seconds'], reverse=True)
+    summary = ', '.join(f"{name} {stats['seconds']:.2f} с "
+                        f"({stats['calls']})" for name, stats in stages)
+    logging.info(f"Всего {report['total_seconds']:.1f} с, "
+                 f"актов: {report['acts']}. Этапы: {summary}")
+    if report_path:
+        try:
+            metrics.save(report_path)
+        except OSError as e:
+            logging.warning(f"Отчёт '{report_path}' не записан: {e}")
 
-def process_acts(ws_data, ws_template, output_wb, output_path):
-    '''Обработка актов из данных Excel с созданием листов в одном файле.'''
-    dkbs = ('документ о качестве бетонной смеси заданного '
-            'состава качества партии')
-    name_uzk = ('Протокол оценки прочности бетона монолитных '
-                'железобетонных конструкций')
-    name_k1 = ('Акт отбора проб бетонной смеси и изготовления '
-               'контрольных образцов')
-    name_k2 = ('Протокол оценки прочности бетона монолитных '
-               'конструкций')
 
-    processed_count = 0
+def iter_acts(records, document=DOCUMENT_TYPES['beton'], reuse=frozenset()):
+    '''Перебирает записи актов: (id, имя листа, замены, скрытые строки).
 
-    for row in ws_data.iter_rows(min_row=3, values_only=True):
+    Для актов из reuse замены не вычисляются и возвращаются как None.
+    Ошибки отдельных строк логируются, такие строки пропускаются.
+    '''
+    for record in records:
         # Пропускаем пустые строки
-        if not row[0]:
+        if not record.id:
+            continue
+
+        id = record.id
+        if id in reuse:
+            yield id, act_sheet_title(id), None, None
             continue
 
         try:
-            '''Сохраняем данные из файла Excel в переменные.'''
-            id = row[0]
-            act_number = str(row[1])
-            work_name = str(row[2])
-            start_date = format_date(row[3])
-            end_date = format_date(row[4])
-            concrete_type = str(row[5])
-            mixture_number = str(row[7])
-            mixture_date = format_date(row[9])
-            lab_uzk = str(row[10]) if row[10] else ''
-            lab_k = str(row[11]) if row[11] else ''
-            lab_date = format_date(row[12])
-            code = str(row[13])
-            agreement_date = format_date(row[14])
-
-            logging.info(f"Обработка акта №{id}")
+            with stage('build'):
+                replacements, rows_to_hide = build_act(document, record)
+        except Exception as e:
+            row_id = record.id if record.id else 'Неизвестно'
+            msg = f"Ошибка при обработке акта №{row_id}: {e}"
+            logging.error(msg)
+            continue
 
+        yield id, act_sheet_title(id), replacements, rows_to_hide
+
+
+def process_acts(records, ws_template, output_wb, output_path,
+                 document=DOCUMENT_TYPES['beton'], reuse=frozenset(),
+                 progress=None, compression='normal', template_plan=None):
+    '''Обработка актов из данных Excel с созданием листов в одном файле.
+
+    Листы актов из reuse уже есть в output_wb и не пересоздаются.
+    template_plan — (план, разметка) листа шаблона из кеша
+    (act_cache.load_template_plan); без него лист разбирается здесь.
+    Возвращает {id акта строкой: имя листа}.
+    '''
+    outputs = {}
+    if progress is None:
+        progress = ActProgress(document.title)
+
+    # Плейсхолдеры, ячейки, стили, объединения и размеры шаблона
+    # разбираются один раз, а не на каждом акте
+    if template_plan is None:
+        template_plan = compile_template(ws_template), SheetLayout(ws_template)
+    plan, layout = template_plan
+    cloner = SheetCloner(ws_template, output_wb, layout)
+
+    acts = iter_acts(records, document, reuse)
+    for id, sheet_name, replacements, rows_to_hide in acts:
+        if replacements is None:
+            outputs[str(id)] = sheet_name
+            continue
+
+        try:
             # Создаем новый лист для текущего акта
-            sheet_name = f'Акт №{id}'
-            ws_new = copy_worksheet(ws_template, output_wb, sheet_name)
-
-            # Упрощенная проверка даты акта
-            act_date = get_act_date(row[4], row[12], row[14])
-
-            # Проверка ЖАН
-            agreement = (f'Запись из ЖАН от {agreement_date}'
-                         if agreement_date else '')
-
-            # Проверка материалов, реестр или нет
-            if mixture_number == 'Реестр':
-                material1 = (f'Материалы согласно реестру '
-                             f'№{act_number} от {act_date}')
-                material2 = f'Реестр №{act_number} от {act_date}'
-                material1_1, material2_1 = '', ''
-            elif '\n' in mixture_number:
-                mixture_number_parts = mixture_number.split('\n')
-                mixture_date_parts = mixture_date.split('\n')
-                material1 = (f'{concrete_type} - {dkbs} '
-                             f'№{mixture_number_parts[0]} '
-                             f'от {mixture_date_parts[0]}')
-                material1_1 = (f'{concrete_type} - {dkbs} '
-                               f'№{mixture_number_parts[1]} '
-                               f'от {mixture_date_parts[1]}')
-                material2 = (f'{dkbs.capitalize()} '
-                             f'№{mixture_number_parts[0]} '
-                             f'от {mixture_date_parts[0]}')
-                material2_1 = (f'{dkbs.capitalize()} '
-                               f'№{mixture_number_parts[1]} '
-                               f'от {mixture_date_parts[1]}')
-            else:
-                material1 = (f'{concrete_type} - {dkbs} '
-                             f'№{mixture_number} от {mixture_date}')
-                material2 = (f'{dkbs.capitalize()} '
-                             f'№{mixture_number} от {mixture_date}')
-                material1_1, material2_1 = '', ''
-
-            # Проверка лаборатории, УЗК или К
-            if lab_uzk:
-                lab1 = (f'{name_uzk} №{lab_uzk}-УЗК/2/1.3В-2025 '
-                        f'от {lab_date}')
-                lab2 = ''
-            else:
-                lab1 = (f'{name_k1} №{lab_k}-К/2/1.3В-2025 '
-                        f'от {start_date}')
-                lab2 = (f'{name_k2} №{lab_k}-К7/2/1.3В-2025 '
-                        f'от {lab_date}')
-
-            # Список соответствия мест в Excel и переменных
-            replacements = {
-                '[№ акта]': act_number,
-                '[Наименование работ]': work_name,
-                '[Дата начала работы]': start_date,
-                '[Дата окончания работы]': end_date,
-                '[Шифр]': code,
-                '[Согласование]': agreement,
-                '[Материалы1]': material1,
-                '[Материалы2]': material2,
-                '[Материалы1_1]': material1_1,
-                '[Материалы2_1]': material2_1,
-                '[Лаборатория1]': lab1,
-                '[Лаборатория2]': lab2,
-                '[Дата акта]': act_date
-            }
+            ws_new = copy_worksheet(ws_template, output_wb, sheet_name,
+                                    cloner)
 
             # Заполнение ячеек в новом листе
-            for row_cells in ws_new:
-                for cell in row_cells:
-                    if cell.value is not None:
-                        cell_value = str(cell.value)
-                        for placeholder, value in replacements.items():
-                            if placeholder in cell_value:
-                                cell_value = cell_value.replace(
-                                    placeholder, value)
-                        cell.value = cell_value
-
-            # Скрытие строк по известным номерам
-            rows_to_hide = []
-
-            if not material1_1:
-                rows_to_hide.append(76)
-            if not material2_1:
-                rows_to_hide.append(97)
-            if not lab2:
-                rows_to_hide.append(81)
-                rows_to_hide.append(99)
-            if not agreement_date:
-                rows_to_hide.append(100)
-
-            for row_num in rows_to_hide:
-                ws_new.row_dimensions[row_num].hidden = True
-
-            processed_count += 1
-            logging.info(f"Успешно создан лист '{sheet_name}'")
+            with stage('fill'):
+                plan.fill(ws_new, replacements)
+
+            with stage('hide_rows'):
+                for row_num in rows_to_hide:
+                    ws_new.row_dimensions[row_num].hidden = True
+
+            outputs[str(id)] = sheet_name
+            progress.add(id)
 
         except Exception as e:
-            row_id = row[0] if row[0] else 'Неизвестно'
-            msg = f"Ошибка при обработке акта №{row_id}: {e}"
+            msg = f"Ошибка при обработке акта №{id}: {e}"
             logging.error(msg)
             continue
 
+    if reuse:
+        # Переиспользованные и новые листы — в порядке строк данных
+        order = {title: index
+                 for index, title in enumerate(outputs.values())}
+        output_wb._sheets.sort(key=lambda ws: order[ws.title])
+
+    progress.finish()
+
     # Сохраняем финальный файл со всеми актами
-    output_wb.save(output_path)
+    with stage('save'):
+        save_workbook(output_wb, output_path, compression)
+    report_done(len(outputs), output_path)
+    return outputs
+
+
+def process_acts_xml(records, xml_template, output_path,
+                     document=DOCUMENT_TYPES['beton'], reuse=frozenset(),
+                     progress=None, inline_strings=False,
+                     compression='normal', jobs=1,
+                     cache_folder=CACHE_FOLDER, journal=None, resume=False,
+                     queue_depth=0):
+    '''Обработка актов с записью XML листов напрямую в итоговый файл.
+
+    Листы актов из reuse переносятся из прежнего файла без изменений.
+    С inline_strings текст актов пишется прямо в ячейки листов, и память
+    не растёт с числом актов. При jobs > 1 листы строятся и сжимаются в
+    пуле процессов, а этот процесс только дописывает их в файл по
+    порядку; текст актов тогда тоже пишется в ячейки.
+    Сжатие и запись листов в файл идут в отдельном потоке параллельно с
+    построением следующих, в очереди не больше queue_depth листов.
+    Готовые листы записываются в журнал journal (act_journal.ActJournal);
+    с resume листы из журнала прерванного запуска не строятся заново.
+    Возвращает {id акта строкой: имя листа}.
+    '''
+    outputs = {}
+    if progress is None:
+        progress = ActProgress(document.title)
+
+    hashes = {}
+    resumed = []
+    if journal is not None:
+        entries = journal.load() if resume else []
+        resumed, records = resume_prefix(records, entries)
+        records = remember_hashes(records, hashes)
+        journal.start(resumed)
+        if resumed:
+            logging.info(f"Продолжение: готово по журналу листов "
+                         f"{len(resumed)}")
+
+    writer = XmlWorkbookWriter(xml_template, output_path,
+                               previous_path=output_path if reuse else None,
+                               inline_strings=inline_strings or jobs > 1,
+                               compression=compression,
+                               queue_depth=queue_limit(queue_depth,
+                                                       SAVE_THREADS))
+    try:
+        for meta, data in resumed:
+            writer.strings.extend(meta['strings'])
+            with stage('write_sheet'):
+                writer.add_packed_sheet(meta['title'],
+                                        journal_member(meta, data))
+            outputs[meta['id']] = meta['title']
+        if jobs > 1:
+            sheets = render_sheets(records, document, jobs, reuse,
+                                   cache_folder, compression, queue_depth)
+            for id, member in sheets:
+                sheet_name = act_sheet_title(id)
+                if member is None:
+                    with stage('copy_sheet'):
+                        writer.copy_previous_sheet(sheet_name)
+                else:
+                    with stage('write_sheet'):
+                        writer.add_packed_sheet(sheet_name, member)
+                    if journal is not None:
+                        journal.add(id, hashes[str(id)], sheet_name, member)
+                    progress.add(id)
+                outputs[str(id)] = sheet_name
+        else:
+            acts = iter_acts(records, document, reuse)
+            for id, sheet_name, replacements, rows_to_hide in acts:
+                if replacements is None:
+                    with stage('copy_sheet'):
+                        writer.copy_previous_sheet(sheet_name)
+                else:
+                    written = None
+                    if journal is not None:
+                        written = functools.partial(
+                            journal.add, id, hashes[str(id)], sheet_name)
+                    with stage('render_sheet'):
+                        writer.add_sheet(sheet_name, replacements,
+                                         rows_to_hide, written)
+                    progress.add(id)
+                outputs[str(id)] = sheet_name
+    except BaseException:
+        writer.abort()
+        if journal is not None:
+            journal.close()
+        raise
+    progress.finish()
+    with stage('save'):
+        writer.close()
+    if journal is not None:
+        journal.remove()
+
+    report_done(len(outputs), output_path)
+    return outputs
+
+
+def remember_hashes(records, hashes):
+    '''Пропускает записи, собирая хеши строк данных: {id строкой: хеш}.'''
+    for record in records:
+        if record.id:
+            hashes[str(record.id)] = record_hash(record)
+        yield record
+
+
+def shard_path(output_path, number):
+    '''Путь к части общего файла актов: Все_акты_бетон_001.xlsx.'''
+    base, ext = os.path.splitext(output_path)
+    return f'{base}_{number:03d}{ext}'
+
+
+def process_acts_sharded(records, document, output_path, engine='openpyxl',
+                         max_sheets=50, cache_folder=CACHE_FOLDER,
+                         progress=None, compression='normal'):
+    '''Раскладывает акты по файлам не более чем из max_sheets листов.
+
+    Каждая часть сохраняется и освобождается, как только заполнена.
+    Рядом создаётся оглавление: номер акта -> файл и лист.
+    Возвращает {id акта строкой: «файл!лист»}.
+    '''
+    numbers = {}
+
+    def remember(records):
+        for record in records:
+            if record.id:
+                numbers[str(record.id)] = record.act_number
+                yield record
+
+    records = remember(records)
+    if progress is None:
+        progress = ActProgress(document.title)
+    with stage('template_load'):
+        if engine != 'openpyxl':
+            template = load_xml_template(document.template_file,
+                                         document.template_sheet,
+                                         cache_folder)
+        else:
+            wb_template = load_template_workbook(document.template_file,
+                                                 cache_folder)
+            template = wb_template[document.template_sheet]
+            template_plan = load_template_plan(document.template_file,
+                                               document.template_sheet,
+                                               cache_folder)
+    logging.info(f"Загружен файл шаблона: {document.template_file}")
+
+    index = []
+    created = {}
+    shard_count = 0
+    while True:
+        chunk = list(itertools.islice(records, max_sheets))
+        if not chunk:
+            break
+        shard_count += 1
+        path = shard_path(output_path, shard_count)
+        if engine != 'openpyxl':
+            outputs = process_acts_xml(chunk, template, path, document,
+                                       progress=progress,
+                                       inline_strings=engine == 'stream',
+                                       compression=compression)
+        else:
+            outputs = process_acts(chunk, template, new_output_workbook(),
+                                   path, document, progress=progress,
+                                   compression=compression,
+                                   template_plan=template_plan)
+        for id, sheet_name in outputs.items():
+            index.append((id, numbers[id], os.path.basename(path),
+                          sheet_name))
+            created[id] = f'{path}!{sheet_name}'
+
+    # Части, оставшиеся от прежних запусков с большим числом актов
+    stale = shard_count + 1
+    while os.path.exists(shard_path(output_path, stale)):
+        os.remove(shard_path(output_path, stale))
+        stale += 1
+
+    index_path = os.path.splitext(output_path)[0] + '_оглавление.xlsx'
+    index_wb = Workbook(write_only=True)
+    index_ws = index_wb.create_sheet('Оглавление')
+    index_ws.append(['№', '№ акта', 'Файл', 'Лист'])
+    for row in index:
+        index_ws.append(list(row))
+    index_wb.save(index_path)
+    logging.info(f"Оглавление сохранено: {index_path}")
+    print(f"Частей: {shard_count}, оглавление: {index_path}")
+    return created
+
+
+def new_output_workbook():
+    '''Пустая книга для листов актов.'''
+    output_wb = Workbook()
+    # Удаляем стандартный лист
+    if output_wb.active:
+        output_wb.remove(output_wb.active)
+    return output_wb
+
+
+def report_done(processed_count, output_path):
+    '''Итоговые сообщения о завершении обработки.'''
     logging.info(f"Обработка завершена. Создано актов: {processed_count}")
-    logging.info(f"Файл сохранен: {output_path}")
+    size = format_size(os.path.getsize(output_path))
+    logging.info(f"Файл сохранен: {output_path} ({size})")
     print(f"Обработка завершена! Создано актов: {processed_count}")
-    print(f"Все акты сохранены в файл: {output_path}")
+    print(f"Все акты сохранены в файл: {output_path} ({size})")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,166 @@
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import act_metrics
+import autoexec
+from act_cache import (load_template_plan, load_xml_template,
+                       load_zip_template)
+from act_documents import DOCUMENT_TYPES
+
+
+def parse_args(argv=None):
+    '''Разбор параметров командной строки пакетного запуска.
+
+    Неизвестные параметры передаются autoexec для каждой книги данных.
+    '''
+    parser = argparse.ArgumentParser(
+        description='Формирование актов АОСР по нескольким книгам данных',
+        epilog='Остальные параметры (--documents, --all, --engine, '
+               '--incremental, --compression и т.д.) передаются '
+               'autoexec.py для каждой книги.')
+    parser.add_argument(
+        'data', nargs='+',
+        help='книги данных или шаблоны имён, например "я. Бетон (*).xlsx"')
+    parser.add_argument(
+        '--output-root', default='Акты',
+        help='корневая папка: акты каждой книги — в подпапке с её именем')
+    parser.add_argument(
+        '--workers', type=int, default=0,
+        help='число книг, обрабатываемых параллельно (0 — по числу ядер)')
+    args, autoexec_argv = parser.parse_known_args(argv)
+    args.autoexec_argv = autoexec_argv
+    args.workers = args.workers or os.cpu_count()
+    return args
+
+
+def find_data_files(patterns):
+    '''Книги данных по списку путей и шаблонов имён, без повторов.'''
+    files = []
+    for pattern in patterns:
+        # Путь без совпадений остаётся в списке: его отсутствие будет
+        # в сводке ошибкой, а не пропущено молча
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            # Временные файлы Excel открытых книг
+            if os.path.basename(path).startswith('~$'):
+                continue
+            if path not in files:
+                files.append(path)
+    return files
+
+
+def output_dir(output_root, data_file):
+    '''Папка актов книги данных: <корень>/<имя книги без расширения>.'''
+    name = os.path.splitext(os.path.basename(data_file))[0]
+    return os.path.join(output_root, name)
+
+
+def warm_templates(autoexec_argv):
+    '''Разбирает шаблоны один раз до запуска рабочих процессов.
+
+    Рабочие процессы читают готовый кеш шаблонов, а не разбирают
+    шаблоны каждый заново.
+    '''
+    args = autoexec.parse_args(autoexec_argv)
+    if args.cache_folder is None:
+        return
+    for key in args.documents:
+        document = DOCUMENT_TYPES[key]
+        if not os.path.exists(document.template_file):
+            continue
+        if args.engine == 'openpyxl':
+            load_template_plan(document.template_file,
+                               document.template_sheet, args.cache_folder)
+        elif document.output_file:
+            load_xml_template(document.template_file,
+                              document.template_sheet, args.cache_folder)
+        else:
+            load_zip_template(document.template_file,
+                              document.template_sheet, args.cache_folder)
+
+
+def process_data_file(data_file, output_root, autoexec_argv):
+    '''Формирует акты одной книги данных. Выполняется в рабочем процессе.'''
+    folder = output_dir(output_root, data_file)
+    os.makedirs(folder, exist_ok=True)
+    argv = autoexec_argv + [
+        '--data', data_file,
+        '--output-dir', folder,
+        '--report', os.path.join(folder, 'autoexec_report.json'),
+    ]
+    started = time.perf_counter()
+    try:
+        args = autoexec.parse_args(argv)
+        ok = autoexec.run(args, autoexec.select_documents(args))
+    except SystemExit:
+        # Ошибка в параметрах командной строки
+        ok = False
+    return {
+        'data': data_file,
+        'output': folder,
+        'ok': ok,
+        'acts': act_metrics.metrics.acts,
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def print_summary(results, elapsed):
+    '''Сводка пакетного запуска по книгам и итог.'''
+    print()
+    print(f"{'Книга данных':<40} {'Актов':>6} {'Время, с':>9}  Результат")
+    for result in results:
+        status = 'готово' if result['ok'] else 'ОШИБКА'
+        print(f"{os.path.basename(result['data'])[:40]:<40} "
+              f"{result['acts']:>6} {result['seconds']:>9.1f}  {status}")
+    acts = sum(result['acts'] for result in results)
+    failed = sum(not result['ok'] for result in results)
+    print(f"Книг: {len(results)}, с ошибками: {failed}, актов: {acts}, "
+          f"время: {elapsed:.1f} с")
+    logging.info(f"Пакетная обработка завершена. Книг: {len(results)}, "
+                 f"с ошибками: {failed}, актов: {acts}, "
+                 f"время: {elapsed:.1f} с")
+
+
+def main(argv=None):
+    '''Пакетное формирование актов по нескольким книгам данных.'''
+    args = parse_args(argv)
+    autoexec.setup_logging()
+
+    data_files = find_data_files(args.data)
+    if not data_files:
+        print('Книги данных не найдены')
+        sys.exit(1)
+    logging.info(f"Книг данных: {len(data_files)}, "
+                 f"процессов: {min(args.workers, len(data_files))}")
+
+    started = time.perf_counter()
+    warm_templates(args.autoexec_argv)
+
+    if args.workers > 1 and len(data_files) > 1:
+        with ProcessPoolExecutor(
+                max_workers=min(args.workers, len(data_files)),
+                initializer=autoexec.setup_logging) as executor:
+            futures = [
+                executor.submit(process_data_file, data_file,
+                                args.output_root, args.autoexec_argv)
+                for data_file in data_files
+            ]
+            results = [future.result() for future in futures]
+    else:
+        results = [
+            process_data_file(data_file, args.output_root,
+                              args.autoexec_argv)
+            for data_file in data_files
+        ]
+
+    print_summary(results, time.perf_counter() - started)
+    if not all(result['ok'] for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
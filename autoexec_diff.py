@@ -0,0 +1,304 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import unescape
+
+from act_xml import (ATTRIBUTE, NS_MAIN, SHARED_STRING, read_sheet_parts,
+                     string_text)
+
+
+# Части сравнения листа в порядке вывода
+SECTIONS = ('cells', 'hidden_rows', 'merges', 'print')
+
+# Элементы листа с настройками печати; ссылки на части пакета (r:id)
+# от файла к файлу разные и не сравниваются
+PRINT_ELEMENTS = re.compile(
+    r'<(printOptions|pageMargins|pageSetup)\b([^>]*?)/?>')
+PAGE_BREAKS = re.compile(r'<(rowBreaks|colBreaks)\b.*?</\1>', re.S)
+BREAK = re.compile(r'<brk\b[^>]*?\sid="(\d+)"')
+# Строки листа и непустые ячейки: пустые <c .../> пропускаются самим
+# выражением, их в листе актов большинство
+ROW = re.compile(r'<row\b([^>]*)>')
+CELL = re.compile(r'<c\b([^>/]*)>(.*?)</c>', re.S)
+MERGE_CELL = re.compile(r'<mergeCell\s+ref="([^"]+)"')
+FORMULA = re.compile(r'<f\b[^>]*>(.*?)</f>', re.S)
+VALUE = re.compile(r'<v>(.*?)</v>', re.S)
+
+SECTION_TITLES = {
+    'cells': 'ячейки',
+    'hidden_rows': 'скрытые строки',
+    'merges': 'объединения',
+    'print': 'печать',
+}
+
+
+def number_text(text):
+    '''Число ячейки без различий записи: 1, 1.0 и 1E0 дают "1".'''
+    try:
+        number = float(text)
+    except ValueError:
+        return text
+    return str(int(number)) if number.is_integer() else repr(number)
+
+
+def cell_value(attrs, body, strings):
+    '''Значение ячейки для сравнения или None для пустой.
+
+    У ячеек с формулой сравнивается формула: кешированное значение
+    пишется не всеми движками.
+    '''
+    if '<f' in body:
+        formula = FORMULA.search(body)
+        if formula and formula.group(1):
+            return '=' + unescape(formula.group(1))
+    cell_type = attrs.get('t', 'n')
+    if cell_type == 'inlineStr':
+        return string_text(body) or None
+    value = VALUE.search(body)
+    if value is None:
+        return None
+    text = value.group(1)
+    if '&' in text:
+        text = unescape(text)
+    if cell_type == 's':
+        return strings[int(text)] or None
+    if cell_type == 'n':
+        return number_text(text)
+    return text or None
+
+
+def print_settings(sheet_xml, print_area):
+    '''Настройки печати листа: {элемент.атрибут: значение}.
+
+    Разрывы страниц — номера строк и столбцов через пробел, область
+    печати — диапазон без имени листа.
+    '''
+    settings = {}
+    for element, attributes in PRINT_ELEMENTS.findall(sheet_xml):
+        for name, value in ATTRIBUTE.findall(attributes):
+            if name == 'r:id':
+                continue
+            settings[f'{element}.{name}'] = number_text(value)
+    for match in PAGE_BREAKS.finditer(sheet_xml):
+        settings[match.group(1)] = ' '.join(BREAK.findall(match.group(0)))
+    if print_area:
+        settings['print_area'] = print_area
+    return settings
+
+
+def sheet_fingerprint(sheet_xml, strings, print_area=None):
+    '''Сравниваемое содержимое листа: значения, скрытые строки,
+    объединения и настройки печати.'''
+    cells = {}
+    for head, body in CELL.findall(sheet_xml):
+        attrs = dict(ATTRIBUTE.findall(head))
+        value = cell_value(attrs, body, strings)
+        if value is not None:
+            cells[attrs['r']] = value
+    hidden = []
+    for head in ROW.findall(sheet_xml):
+        if 'hidden=' in head:
+            attrs = dict(ATTRIBUTE.findall(head))
+            if attrs.get('hidden') in ('1', 'true'):
+                hidden.append(int(attrs['r']))
+    return {
+        'cells': cells,
+        'hidden_rows': sorted(hidden),
+        'merges': sorted(MERGE_CELL.findall(sheet_xml)),
+        'print': print_settings(sheet_xml, print_area),
+    }
+
+
+def fingerprint_digest(fingerprint):
+    '''Хеш содержимого листа: совпадающие листы сравниваются только по нему.'''
+    data = json.dumps(fingerprint, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def print_areas(zf):
+    '''Области печати листов книги без имени листа: {номер листа: диапазон}.'''
+    areas = {}
+    workbook = ET.fromstring(zf.read('xl/workbook.xml'))
+    for name in workbook.iter(f'{{{NS_MAIN}}}definedName'):
+        sheet_id = name.get('localSheetId')
+        if (name.get('name') == '_xlnm.Print_Area' and sheet_id is not None
+                and name.text and '#' not in name.text):
+            areas[int(sheet_id)] = name.text.rsplit('!', 1)[-1]
+    return areas
+
+
+def read_workbook(path):
+    '''Листы книги: [(имя листа, отпечаток)] в порядке книги.'''
+    with zipfile.ZipFile(path) as zf:
+        strings = []
+        if 'xl/sharedStrings.xml' in zf.namelist():
+            sst = zf.read('xl/sharedStrings.xml').decode('utf-8')
+            strings = [string_text(item)
+                       for item in SHARED_STRING.findall(sst)]
+        areas = print_areas(zf)
+        return [
+            (title, sheet_fingerprint(zf.read(part).decode('utf-8'),
+                                      strings, areas.get(index)))
+            for index, (title, part) in enumerate(read_sheet_parts(zf))
+        ]
+
+
+def workbook_files(path):
+    '''Книги для сравнения: сам файл или все .xlsx папки.'''
+    if os.path.isdir(path):
+        return sorted(
+            os.path.join(path, name) for name in os.listdir(path)
+            if name.lower().endswith('.xlsx') and not name.startswith('~$'))
+    return [path]
+
+
+def iter_sheets(path):
+    '''Листы файла или папки: (ключ, отпечаток).
+
+    Для файла ключ — имя листа, для папки — «файл!лист».
+    '''
+    folder = os.path.isdir(path)
+    for file_path in workbook_files(path):
+        for title, fingerprint in read_workbook(file_path):
+            if folder:
+                yield f'{os.path.basename(file_path)}!{title}', fingerprint
+            else:
+                yield title, fingerprint
+
+
+def diff_section(section, expected, actual, max_cells):
+    '''Различия одной части листа в виде строк отчёта.'''
+    if section == 'hidden_rows':
+        expected, actual = set(expected), set(actual)
+        lines = []
+        if actual - expected:
+            lines.append('+' + ' '.join(map(str, sorted(actual - expected))))
+        if expected - actual:
+            lines.append('-' + ' '.join(map(str, sorted(expected - actual))))
+        return lines
+    if section == 'merges':
+        expected, actual = set(expected), set(actual)
+        return ([f'+{ref}' for ref in sorted(actual - expected)]
+                + [f'-{ref}' for ref in sorted(expected - actual)])
+    keys = sorted(set(expected) | set(actual), key=cell_order)
+    changed = [key for key in keys if expected.get(key) != actual.get(key)]
+    lines = [f'{key}: {expected.get(key)!r} -> {actual.get(key)!r}'
+             for key in changed[:max_cells]]
+    if len(changed) > max_cells:
+        lines.append(f'... ещё {len(changed) - max_cells}')
+    return lines
+
+
+def cell_order(key):
+    '''Порядок ячеек по строкам, затем по столбцам; прочие ключи — как есть.'''
+    match = re.fullmatch(r'([A-Z]+)(\d+)', key)
+    if match is None:
+        return (0, 0, key)
+    return (int(match.group(2)), len(match.group(1)), match.group(1))
+
+
+def diff_sheets(expected, actual, max_cells=20):
+    '''Различия двух отпечатков листа: {часть: [строки отчёта]}.'''
+    differences = {}
+    for section in SECTIONS:
+        if expected[section] != actual[section]:
+            differences[section] = diff_section(
+                section, expected[section], actual[section], max_cells)
+    return differences
+
+
+def compare(expected_path, actual_path, max_cells=20):
+    '''Сравнивает выходные файлы актов. Возвращает отчёт в виде словаря.
+
+    Эталон читается целиком в виде хешей и отпечатков, проверяемый
+    вывод — потоково, лист за листом.
+    '''
+    expected = dict(iter_sheets(expected_path))
+    digests = {key: fingerprint_digest(fingerprint)
+               for key, fingerprint in expected.items()}
+    report = {
+        'expected': expected_path,
+        'actual': actual_path,
+        'sheets': 0,
+        'same': 0,
+        'changed': {},
+        'missing': [],
+        'extra': [],
+    }
+    seen = set()
+    for key, fingerprint in iter_sheets(actual_path):
+        seen.add(key)
+        report['sheets'] += 1
+        if key not in expected:
+            report['extra'].append(key)
+        elif digests[key] == fingerprint_digest(fingerprint):
+            report['same'] += 1
+        else:
+            report['changed'][key] = diff_sheets(expected[key], fingerprint,
+                                                 max_cells)
+    report['missing'] = [key for key in expected if key not in seen]
+    return report
+
+
+def print_report(report):
+    for key, differences in report['changed'].items():
+        print(f'{key}:')
+        for section, lines in differences.items():
+            print(f'  {SECTION_TITLES[section]}:')
+            for line in lines:
+                print(f'    {line}')
+    for key in report['missing']:
+        print(f'{key}: нет в проверяемом выводе')
+    for key in report['extra']:
+        print(f'{key}: нет в эталоне')
+    print(f"Листов: {report['sheets']}, совпадают: {report['same']}, "
+          f"различаются: {len(report['changed'])}, "
+          f"нет в проверяемом: {len(report['missing'])}, "
+          f"нет в эталоне: {len(report['extra'])}, "
+          f"время: {report['seconds']:.1f} с")
+
+
+def parse_args(argv=None):
+    '''Разбор параметров командной строки.'''
+    parser = argparse.ArgumentParser(
+        description='Сравнение сформированных актов с эталоном: значения '
+                    'ячеек, скрытые строки, объединения и настройки печати')
+    parser.add_argument(
+        'expected', help='эталон: общий файл актов или папка с файлами')
+    parser.add_argument(
+        'actual', help='проверяемый вывод: файл или папка того же вида')
+    parser.add_argument(
+        '--max-cells', type=int, default=20,
+        help='сколько различающихся ячеек выводить на лист')
+    parser.add_argument(
+        '--json', metavar='FILE',
+        help='записать отчёт в JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    '''Сравнение актов; код выхода 1, если есть различия.'''
+    args = parse_args(argv)
+    for path in (args.expected, args.actual):
+        if not os.path.exists(path):
+            print(f"Ошибка: '{path}' не найден")
+            sys.exit(2)
+    started = time.perf_counter()
+    report = compare(args.expected, args.actual, args.max_cells)
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+    if report['changed'] or report['missing'] or report['extra']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,429 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import act_metrics
+import autoexec
+from act_cache import (CACHE_FOLDER, load_template_plan,
+                       load_template_workbook, load_xml_template,
+                       load_zip_template)
+from act_documents import DOCUMENT_TYPES
+
+
+# Параметры задания в запросе и соответствующие параметры autoexec
+JOB_OPTIONS = {
+    'data': '--data',
+    'output_dir': '--output-dir',
+    'rows': '--rows',
+    'engine': '--engine',
+    'compression': '--compression',
+    'max_sheets': '--max-sheets',
+    'queue_depth': '--queue-depth',
+}
+JOB_FLAGS = {
+    'incremental': '--incremental',
+    'resume': '--resume',
+}
+
+# Сколько завершённых заданий хранится для запросов состояния
+JOB_HISTORY = 1000
+
+
+def parse_args(argv=None):
+    '''Разбор параметров командной строки сервиса.'''
+    parser = argparse.ArgumentParser(
+        description='Сервис формирования актов АОСР: JSON API по HTTP '
+                    'с пулом процессов, в которых шаблоны уже загружены')
+    parser.add_argument(
+        '--host', default='127.0.0.1',
+        help='адрес для подключения (по умолчанию только этот компьютер)')
+    parser.add_argument(
+        '--port', type=int, default=8765,
+        help='порт HTTP')
+    parser.add_argument(
+        '--workers', type=int, default=0,
+        help='число рабочих процессов (0 — по числу ядер)')
+    parser.add_argument(
+        '--queue-size', type=int, default=16,
+        help='сколько заданий может ждать в очереди сверх выполняемых')
+    parser.add_argument(
+        '--output-root', default='jobs',
+        help='папка для выходных файлов заданий без output_dir: каждое '
+             'такое задание пишет в свою подпапку. Для --incremental и '
+             '--resume задайте в задании постоянный output_dir')
+    parser.add_argument(
+        '--no-cache', dest='cache_folder', action='store_const',
+        const=None, default=CACHE_FOLDER,
+        help=f'не использовать кеш разобранных шаблонов и снимков '
+             f'книги данных (папка {CACHE_FOLDER})')
+    args = parser.parse_args(argv)
+    args.workers = args.workers or os.cpu_count()
+    return args
+
+
+def job_argv(job, cache_folder=CACHE_FOLDER):
+    '''Параметры autoexec для задания из JSON-запроса.
+
+    Задание: {"data": "книга.xlsx", "documents": ["gi"], "rows": "5-20",
+    "engine": "xml", ...}. Отчёт о запуске в файл не пишется, замеры
+    возвращаются в ответе.
+    '''
+    if not isinstance(job, dict):
+        raise ValueError('Задание должно быть объектом JSON')
+    unknown = set(job) - set(JOB_OPTIONS) - set(JOB_FLAGS) - {'documents'}
+    if unknown:
+        raise ValueError(f"Неизвестные параметры задания: "
+                         f"{', '.join(sorted(unknown))}")
+    argv = ['--report', '']
+    if cache_folder is None:
+        argv.append('--no-cache')
+    documents = job.get('documents')
+    if documents:
+        if isinstance(documents, str):
+            documents = [documents]
+        argv += ['--documents'] + [str(key) for key in documents]
+    for key, option in JOB_OPTIONS.items():
+        value = job.get(key)
+        if value is None or value == '':
+            continue
+        if isinstance(value, list):
+            value = ','.join(map(str, value))
+        argv += [option, str(value)]
+    for key, option in JOB_FLAGS.items():
+        if job.get(key):
+            argv.append(option)
+    return argv
+
+
+def check_argv(argv):
+    '''Проверяет параметры задания разбором autoexec.
+
+    Неверные параметры дают ValueError с текстом ошибки argparse.
+    '''
+    stderr = io.StringIO()
+    try:
+        with contextlib.redirect_stderr(stderr):
+            autoexec.parse_args(argv)
+    except SystemExit:
+        message = stderr.getvalue().strip().splitlines()
+        raise ValueError(message[-1] if message else 'Неверные параметры')
+
+
+class ErrorLog(logging.Handler):
+    '''Сообщения об ошибках, записанные в журнал во время задания.'''
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def _init_worker(cache_folder):
+    '''Загружает шаблоны всех видов документов в рабочий процесс.
+
+    Разобранные шаблоны остаются в памяти процесса (act_cache), поэтому
+    задания не тратят время на запуск Python и разбор шаблонов.
+    '''
+    autoexec.setup_logging()
+    if cache_folder is None:
+        return
+    for document in DOCUMENT_TYPES.values():
+        if not os.path.exists(document.template_file):
+            continue
+        load_template_workbook(document.template_file, cache_folder)
+        load_template_plan(document.template_file, document.template_sheet,
+                           cache_folder)
+        if document.output_file:
+            load_xml_template(document.template_file,
+                              document.template_sheet, cache_folder)
+        else:
+            load_zip_template(document.template_file,
+                              document.template_sheet, cache_folder)
+
+
+def _ready():
+    return os.getpid()
+
+
+def run_job(argv, submitted):
+    '''Выполняет задание в рабочем процессе и возвращает его результат.'''
+    started = time.time()
+    errors = ErrorLog()
+    logging.getLogger().addHandler(errors)
+    try:
+        args = autoexec.parse_args(argv)
+        outputs = {}
+        ok = autoexec.run(args, autoexec.select_documents(args), outputs)
+    finally:
+        logging.getLogger().removeHandler(errors)
+    report = act_metrics.metrics.report()
+    return {
+        'ok': ok,
+        'outputs': outputs,
+        'errors': errors.messages,
+        'acts': report['acts'],
+        'queued_seconds': round(started - submitted, 3),
+        'seconds': report['total_seconds'],
+        'stages': report['stages'],
+        'worker': os.getpid(),
+    }
+
+
+class QueueFull(Exception):
+    '''Очередь заданий заполнена.'''
+
+
+class OutputBusy(Exception):
+    '''Папка вывода занята другим заданием.'''
+
+
+class JobService:
+    '''Очередь заданий и пул рабочих процессов с загруженными шаблонами.
+
+    Одновременно выполняется не больше workers заданий, ещё queue_size
+    ждут в очереди; задания сверх этого отклоняются, а не копятся.
+    Задания не пишут в одну папку: без output_dir задание получает
+    свою подпапку в output_root, а задание с папкой, занятой другим
+    незавершённым заданием, отклоняется.
+    '''
+
+    def __init__(self, workers, queue_size, cache_folder=CACHE_FOLDER,
+                 output_root='jobs'):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.cache_folder = cache_folder
+        self.output_root = output_root
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            initargs=(cache_folder,))
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.started = time.time()
+
+    def warm_up(self):
+        '''Запускает все рабочие процессы и ждёт загрузки шаблонов.'''
+        started = time.perf_counter()
+        futures = [self.executor.submit(_ready)
+                   for _ in range(self.workers)]
+        wait(futures)
+        logging.info(f"Рабочих процессов: {self.workers}, шаблоны "
+                     f"загружены за {time.perf_counter() - started:.1f} с")
+
+    def submit(self, job):
+        '''Ставит задание в очередь и возвращает его запись.
+
+        ValueError — неверные параметры, QueueFull — очередь заполнена,
+        OutputBusy — папка вывода занята другим заданием.
+        '''
+        argv = job_argv(job, self.cache_folder)
+        check_argv(argv)
+        if not self.slots.acquire(blocking=False):
+            raise QueueFull(f"В очереди уже "
+                            f"{self.workers + self.queue_size} заданий")
+        try:
+            with self.lock:
+                entry = self._add_entry(job, argv)
+        except BaseException:
+            self.slots.release()
+            raise
+        try:
+            future = self.executor.submit(run_job, argv, time.time())
+        except BaseException:
+            self.slots.release()
+            with self.lock:
+                del self.jobs[entry['id']]
+            raise
+        entry['future'] = future
+        future.add_done_callback(lambda future: self._done(entry, future))
+        logging.info(f"Задание {entry['id']} принято: {' '.join(argv)}")
+        return entry
+
+    def _add_entry(self, job, argv):
+        '''Запись нового задания с его папкой вывода (под self.lock).'''
+        submitted = datetime.now()
+        id = str(next(self.ids))
+        output_dir = str(job.get('output_dir') or '')
+        if not output_dir:
+            # Время в имени отличает папки заданий разных запусков
+            # сервиса с одинаковыми номерами
+            output_dir = os.path.join(
+                self.output_root, f'{submitted:%Y%m%d_%H%M%S}_{id}')
+            argv += ['--output-dir', output_dir]
+        folder = os.path.normcase(os.path.abspath(output_dir))
+        for other in self.jobs.values():
+            if other['result'] is None and other['folder'] == folder:
+                raise OutputBusy(f"Папка '{output_dir}' занята заданием "
+                                 f"{other['id']}")
+        entry = {
+            'id': id,
+            'request': job,
+            'output_dir': output_dir,
+            'folder': folder,
+            'submitted': submitted.isoformat(timespec='seconds'),
+            'result': None,
+        }
+        self.jobs[id] = entry
+        self._trim()
+        return entry
+
+    def _done(self, entry, future):
+        self.slots.release()
+        try:
+            entry['result'] = future.result()
+        except Exception as e:
+            entry['result'] = {'ok': False, 'errors': [str(e)]}
+        result = entry['result']
+        logging.info(f"Задание {entry['id']} завершено: "
+                     f"{'готово' if result['ok'] else 'ошибка'}, "
+                     f"актов: {result.get('acts', 0)}, "
+                     f"время: {result.get('seconds', 0):.2f} с")
+
+    def _trim(self):
+        '''Забывает самые старые завершённые задания сверх JOB_HISTORY.'''
+        finished = [id for id, entry in self.jobs.items()
+                    if entry['result'] is not None]
+        for id in finished[:max(len(self.jobs) - JOB_HISTORY, 0)]:
+            del self.jobs[id]
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def wait(self, entry):
+        '''Ждёт завершения задания.'''
+        wait([entry['future']])
+        # Обработчик завершения мог ещё не отработать
+        while entry['result'] is None:
+            time.sleep(0.01)
+
+    def describe(self, entry):
+        '''Задание для ответа: без внутренних объектов.'''
+        future = entry.get('future')
+        if entry['result'] is not None:
+            status = 'done' if entry['result']['ok'] else 'failed'
+        elif future is not None and future.running():
+            status = 'running'
+        else:
+            status = 'queued'
+        return {
+            'id': entry['id'],
+            'status': status,
+            'submitted': entry['submitted'],
+            'request': entry['request'],
+            'output_dir': entry['output_dir'],
+            'result': entry['result'],
+        }
+
+    def status(self):
+        with self.lock:
+            entries = list(self.jobs.values())
+        states = [self.describe(entry)['status'] for entry in entries]
+        return {
+            'workers': self.workers,
+            'queue_size': self.queue_size,
+            'uptime_seconds': round(time.time() - self.started, 1),
+            'jobs': {state: states.count(state)
+                     for state in ('queued', 'running', 'done', 'failed')},
+            'documents': sorted(DOCUMENT_TYPES),
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    '''JSON API сервиса.
+
+    POST /jobs          — поставить задание; с "wait": true ответ
+                          приходит после его выполнения
+    GET  /jobs/<id>     — состояние и результат задания
+    GET  /status        — рабочие процессы и очередь
+    '''
+
+    service = None
+
+    def do_GET(self):
+        if self.path == '/status':
+            self._reply(200, self.service.status())
+        elif self.path.startswith('/jobs/'):
+            entry = self.service.get(self.path[len('/jobs/'):])
+            if entry is None:
+                self._reply(404, {'error': 'Задание не найдено'})
+            else:
+                self._reply(200, self.service.describe(entry))
+        else:
+            self._reply(404, {'error': 'Неизвестный адрес'})
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            self._reply(404, {'error': 'Неизвестный адрес'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            job = json.loads(self.rfile.read(length) or b'{}')
+            wait_result = isinstance(job, dict) and job.pop('wait', False)
+            entry = self.service.submit(job)
+        except QueueFull as e:
+            self._reply(503, {'error': str(e)})
+            return
+        except OutputBusy as e:
+            self._reply(409, {'error': str(e)})
+            return
+        except ValueError as e:
+            self._reply(400, {'error': str(e)})
+            return
+        if wait_result:
+            self.service.wait(entry)
+            self._reply(200, self.service.describe(entry))
+        else:
+            self._reply(202, self.service.describe(entry))
+
+    def _reply(self, code, body):
+        data = json.dumps(body, ensure_ascii=False, indent=1).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+
+def main(argv=None):
+    '''Запуск сервиса формирования актов.'''
+    args = parse_args(argv)
+    autoexec.setup_logging()
+
+    service = JobService(args.workers, args.queue_size, args.cache_folder,
+                         args.output_root)
+    service.warm_up()
+    ServiceHandler.service = service
+    server = ThreadingHTTPServer((args.host, args.port), ServiceHandler)
+    logging.info(f"Сервис запущен: http://{args.host}:{args.port}. "
+                 f"Для выхода нажмите Ctrl+C")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Сервис остановлен")
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,366 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+
+import openpyxl
+from openpyxl import Workbook
+
+from act_cache import load_template_plan, load_xml_template
+from act_data import ACT_COLUMNS, iter_sheet_records, open_data_workbook
+from act_documents import DOCUMENT_TYPES
+
+try:
+    import resource
+except ImportError:
+    # Windows: пиковая память не измеряется
+    resource = None
+
+
+SIZES = (10, 100, 1000, 5000)
+
+# Прогоны: (вид документа, движок общего файла)
+CASES = (
+    ('beton', 'openpyxl'),
+    ('beton', 'xml'),
+    ('gi', None),
+    ('arm', None),
+)
+
+# Замедление относительно прошлого прогона, считающееся регрессией
+REGRESSION_THRESHOLD = 0.1
+
+WORK_NAME = ('{work} стен\nв осях: {n} - {m}/1(-0.015) / А\n'
+             'с ПК98+20.051 по ПК98+32.101 на отм. 117.923 до 126.589')
+CODE = 'ИМИП-МРАЛ1-Р-Г0100-СТ01-{n:03d}-01-КЖ12'
+GI_MATERIALS = ('Праймер битумный\n'
+                'Гидроизоляция рулонная битумно-полимерная')
+GI_PASSPORTS = ('паспорт качества №27 от 15.05.2025\n'
+                'паспорт качества №2 от 03.02.2025')
+
+
+def concrete_row(n, day):
+    '''Строка листа бетона: К и УЗК, две смеси, реестр, без ЖАН.'''
+    row = {
+        'id': n,
+        'act_number': f'07/25Б-{n}',
+        'work_name': WORK_NAME.format(
+            work='Устройство выравнивающего слоя', n=n, m=n + 2),
+        'start_date': day,
+        'end_date': day,
+        'concrete_type': 'БСМ В15F150W4',
+        'volume': round(0.5 + n % 7 * 0.31, 2),
+        'mixture_number': f'04-0000{27000 + n}',
+        'mixture_volume': n % 3 + 1,
+        'mixture_date': day,
+        'lab_k': f'{100 + n}.1',
+        'lab_date': day + timedelta(days=7),
+        'code': CODE.format(n=n % 50),
+        'agreement_date': day - timedelta(days=3),
+    }
+    if n % 4 == 1:
+        row['lab_uzk'], row['lab_k'] = row['lab_k'], None
+    if n % 4 == 2:
+        row['mixture_number'] = (f'04-0000{27000 + n}\n'
+                                 f'04-0000{27001 + n}')
+        row['mixture_date'] = (f'{day:%d.%m.%Y}\n'
+                               f'{day + timedelta(days=1):%d.%m.%Y}')
+    if n % 4 == 3:
+        row['mixture_number'] = 'Реестр'
+    if n % 3 == 0:
+        row['agreement_date'] = None
+    return row
+
+
+def gi_row(n, day):
+    '''Строка листа ГИ: один и два материала, без лаборатории и ЖАН.'''
+    row = {
+        'id': n,
+        'act_number': f'07/25Г-{n}',
+        'work_name': WORK_NAME.format(
+            work=f'Устройство {n % 3 + 1}-го слоя гидроизоляции',
+            n=n, m=n + 1),
+        'start_date': day,
+        'end_date': day,
+        'concrete_type': 'Устройство защитного слоя гидроизоляции',
+        'volume': 42.31,
+        'mixture_number': 'Гидроизоляция рулонная битумно-полимерная',
+        'mixture_volume': 'паспорт качества №2 от 03.02.2025',
+        'lab_k': str(90 + n),
+        'lab_date': day + timedelta(days=1),
+        'code': CODE.format(n=n % 50),
+        'agreement_date': date(2024, 7, 25),
+    }
+    if n % 2 == 0:
+        row['mixture_number'] = GI_MATERIALS
+        row['mixture_volume'] = GI_PASSPORTS
+    if n % 3 == 0:
+        row['lab_k'] = row['lab_date'] = None
+    if n % 5 == 0:
+        row['concrete_type'] = None
+        row['agreement_date'] = None
+    return row
+
+
+def arm_row(n, day):
+    '''Строка листа армирования: только реестр, часть без ЖАН.'''
+    row = {
+        'id': n,
+        'act_number': f'06/25А-{n}',
+        'work_name': WORK_NAME.format(
+            work='Армирование в опалубке', n=n, m=n + 1),
+        'start_date': day,
+        'end_date': day + timedelta(days=5),
+        'mixture_number': 'Реестр',
+        'code': CODE.format(n=n % 50),
+        'agreement_date': day - timedelta(days=7),
+    }
+    if n % 3 == 0:
+        row['agreement_date'] = None
+    return row
+
+
+ROW_BUILDERS = {
+    'beton': concrete_row,
+    'gi': gi_row,
+    'arm': arm_row,
+}
+
+
+def header_rows():
+    '''Две строки заголовка листа данных по ACT_COLUMNS.'''
+    groups, subs = [], []
+    for _, (group, sub) in ACT_COLUMNS:
+        groups.append(None if groups and group in groups else group)
+        subs.append(sub)
+    return groups, subs
+
+
+def write_data_workbook(path, size):
+    '''Создаёт книгу данных из size строк на каждом листе для актов.'''
+    wb = Workbook(write_only=True)
+    first_day = datetime(2025, 7, 1)
+    for key, build_row in ROW_BUILDERS.items():
+        ws = wb.create_sheet(DOCUMENT_TYPES[key].data_sheet)
+        for row in header_rows():
+            ws.append(row)
+        for n in range(1, size + 1):
+            row = build_row(n, first_day + timedelta(days=n % 28))
+            ws.append([row.get(field) for field, _ in ACT_COLUMNS])
+    wb.save(path)
+
+
+def peak_rss_mb(children=False):
+    '''Пиковая память текущего процесса, МБ.
+
+    С children=True — пиковая память самого большого из завершённых
+    дочерних процессов (рабочих пула при jobs > 1); 0, если их не было.
+    '''
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux сообщает килобайты, macOS — байты
+    scale = 1 << 20 if sys.platform == 'darwin' else 1 << 10
+    return round(peak / scale, 1)
+
+
+def folder_size(folder):
+    '''Суммарный размер файлов папки, байт.'''
+    total = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def stage(seconds, acts):
+    '''Показатели этапа.'''
+    return {
+        'seconds': round(seconds, 3),
+        'acts_per_second': round(acts / seconds, 1) if seconds else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'children_peak_rss_mb': peak_rss_mb(children=True),
+    }
+
+
+def run_case(work_dir, data_file, key, engine, jobs):
+    '''Прогон одного вида документа в отдельном процессе.'''
+    # Импорт здесь: autoexec нужен только рабочему процессу
+    from autoexec import generate_document
+
+    os.chdir(work_dir)
+    document = DOCUMENT_TYPES[key]
+    # Общий файл движка openpyxl пишется одним процессом при любом jobs
+    if engine == 'openpyxl':
+        jobs = 1
+    shutil.rmtree(document.output_folder, ignore_errors=True)
+
+    started = time.perf_counter()
+    wb_data = open_data_workbook(data_file)
+    try:
+        records = list(iter_sheet_records(wb_data, document.data_sheet))
+    finally:
+        wb_data.close()
+    read = stage(time.perf_counter() - started, len(records))
+
+    started = time.perf_counter()
+    # Сообщения генерации в отчёт не попадают
+    with contextlib.redirect_stdout(io.StringIO()):
+        generate_document(document, records, engine or 'openpyxl', jobs)
+    generate = stage(time.perf_counter() - started, len(records))
+
+    return {
+        'document': key,
+        'engine': engine,
+        'jobs': jobs,
+        'acts': len(records),
+        'stages': {'read': read, 'generate': generate},
+        'output_bytes': folder_size(document.output_folder),
+    }
+
+
+def prepare_work_dir(work_dir):
+    '''Копирует шаблоны в рабочую папку и заполняет кеш шаблонов.'''
+    for document in DOCUMENT_TYPES.values():
+        shutil.copy(document.template_file, work_dir)
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        for document in DOCUMENT_TYPES.values():
+            load_template_plan(document.template_file,
+                               document.template_sheet)
+        beton = DOCUMENT_TYPES['beton']
+        load_xml_template(beton.template_file, beton.template_sheet)
+    finally:
+        os.chdir(cwd)
+
+
+def case_key(result):
+    return (result['size'], result['document'], result['engine'],
+            result['jobs'])
+
+
+def compare(results, previous_path):
+    '''Сравнивает скорость генерации с прошлым отчётом.
+
+    Возвращает число регрессий.
+    '''
+    with open(previous_path, encoding='utf-8') as f:
+        previous = {case_key(result): result
+                    for result in json.load(f)['results']}
+    regressions = 0
+    for result in results:
+        old = previous.get(case_key(result))
+        if old is None:
+            continue
+        new_rate = result['stages']['generate']['acts_per_second']
+        old_rate = old['stages']['generate']['acts_per_second']
+        if not new_rate or not old_rate:
+            continue
+        change = new_rate / old_rate - 1
+        mark = ''
+        if change < -REGRESSION_THRESHOLD:
+            regressions += 1
+            mark = '  РЕГРЕССИЯ'
+        print(f"{describe(result)}: {old_rate} -> {new_rate} актов/с "
+              f"({change:+.0%}){mark}")
+    return regressions
+
+
+def describe(result):
+    engine = result['engine'] or 'файлы'
+    return (f"{result['size']:>5} строк {result['document']:<5} {engine}, "
+            f"процессов {result['jobs']}")
+
+
+def parse_args(argv=None):
+    '''Разбор параметров командной строки.'''
+    parser = argparse.ArgumentParser(
+        description='Замеры скорости генерации актов на синтетических '
+                    'книгах данных')
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=list(SIZES),
+        help='число строк на каждом листе данных')
+    parser.add_argument(
+        '--documents', nargs='+', choices=sorted(DOCUMENT_TYPES),
+        default=sorted(DOCUMENT_TYPES),
+        help='виды документов для замеров')
+    parser.add_argument(
+        '--jobs', type=int, default=1,
+        help='число процессов для файлов актов и общего файла движка '
+             'xml')
+    parser.add_argument(
+        '--output',
+        default=f'benchmark_{datetime.now():%Y%m%d_%H%M%S}.json',
+        help='файл отчёта JSON')
+    parser.add_argument(
+        '--compare', metavar='REPORT',
+        help='прошлый отчёт JSON для сравнения скорости')
+    parser.add_argument(
+        '--keep', action='store_true',
+        help='не удалять рабочую папку с данными и актами')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    work_dir = tempfile.mkdtemp(prefix='aosr_benchmark_')
+    prepare_work_dir(work_dir)
+
+    results = []
+    try:
+        for size in args.sizes:
+            data_file = os.path.join(work_dir, f'data_{size}.xlsx')
+            write_data_workbook(data_file, size)
+            for key, engine in CASES:
+                if key not in args.documents:
+                    continue
+                # Каждый прогон — в свежем процессе, чтобы пиковая
+                # память не накапливалась между прогонами
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    result = executor.submit(
+                        run_case, work_dir, data_file, key, engine,
+                        args.jobs).result()
+                result['size'] = size
+                results.append(result)
+                generate = result['stages']['generate']
+                print(f"{describe(result)}: "
+                      f"{generate['seconds']} с, "
+                      f"{generate['acts_per_second']} актов/с, "
+                      f"память {generate['peak_rss_mb']} МБ, "
+                      f"в рабочих процессах "
+                      f"{generate['children_peak_rss_mb']} МБ, "
+                      f"{result['output_bytes'] // 1024} КБ")
+    finally:
+        if args.keep:
+            print(f"Рабочая папка: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'openpyxl': openpyxl.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    print(f"Отчёт сохранён: {args.output}")
+
+    if args.compare and compare(results, args.compare):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
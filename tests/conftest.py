@@ -0,0 +1,84 @@
+import os
+import shutil
+import sys
+import zipfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from act_data import WorkbookData  # noqa: E402
+from act_documents import DOCUMENT_TYPES  # noqa: E402
+from autoexec import generate_document  # noqa: E402
+from autoexec_diff import compare  # noqa: E402
+
+
+# Книга данных из репозитория: листы всех видов документов
+DATA_FILE = 'я. Бетон (Июль).xlsx'
+
+# Части, которые различаются от запуска к запуску (время создания)
+VOLATILE_PARTS = {'docProps/core.xml'}
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    '''Рабочая папка с шаблонами и книгой данных репозитория.'''
+    names = {document.template_file for document in DOCUMENT_TYPES.values()}
+    for name in sorted(names) + [DATA_FILE]:
+        shutil.copy(os.path.join(ROOT, name), tmp_path)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def read_records(document, data_file=DATA_FILE):
+    '''Записи листа данных вида документа.'''
+    data = WorkbookData(data_file)
+    try:
+        return list(data.sheet_records(document.data_sheet))
+    finally:
+        data.close()
+
+
+def output_of(document):
+    '''Общий файл актов или папка с файлами актов.'''
+    if document.output_file:
+        return os.path.join(document.output_folder, document.output_file)
+    return document.output_folder
+
+
+def generate(key, records, output_dir, **options):
+    '''Формирует акты вида key в output_dir без кеша шаблонов.
+
+    Возвращает (вид документа с папкой в output_dir, результат
+    generate_document).
+    '''
+    document = DOCUMENT_TYPES[key]
+    document = document._replace(output_folder=os.path.join(
+        output_dir, document.output_folder))
+    options.setdefault('cache_folder', None)
+    outputs = generate_document(document, iter(records), **options)
+    return document, outputs
+
+
+def content_differences(expected, actual, sections=('cells', 'hidden_rows',
+                                                    'merges')):
+    '''Различия выходных файлов по autoexec_diff в частях sections.'''
+    report = compare(expected, actual)
+    differences = {key: {section: lines
+                         for section, lines in changes.items()
+                         if section in sections}
+                   for key, changes in report['changed'].items()}
+    differences = {key: changes for key, changes in differences.items()
+                   if changes}
+    assert report['sheets'] > 0
+    assert not report['missing'], report['missing']
+    assert not report['extra'], report['extra']
+    return differences
+
+
+def zip_parts(path):
+    '''Части архива без меняющихся от запуска к запуску.'''
+    with zipfile.ZipFile(path) as zf:
+        return {name: zf.read(name) for name in zf.namelist()
+                if name not in VOLATILE_PARTS}
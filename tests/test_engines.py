@@ -0,0 +1,27 @@
+import pytest
+
+from act_documents import DOCUMENT_TYPES
+from conftest import content_differences, generate, output_of, read_records
+
+
+@pytest.mark.parametrize('key', ['beton', 'gi', 'arm'])
+@pytest.mark.parametrize('engine', ['xml', 'stream'])
+def test_engine_matches_openpyxl(workdir, key, engine):
+    '''Значения, скрытые строки и объединения — как у движка openpyxl.'''
+    records = read_records(DOCUMENT_TYPES[key])
+    expected, _ = generate(key, records, 'openpyxl')
+    actual, outputs = generate(key, records, engine, engine=engine)
+
+    assert len(outputs) == len([record for record in records if record.id])
+    assert content_differences(output_of(expected), output_of(actual)) == {}
+
+
+def test_jobs_match_serial_build(workdir):
+    '''Пул процессов даёт те же листы, что и последовательная сборка.'''
+    records = read_records(DOCUMENT_TYPES['beton'])
+    serial, _ = generate('beton', records, 'serial', engine='xml')
+    pooled, _ = generate('beton', records, 'pooled', engine='xml', jobs=2)
+
+    sections = ('cells', 'hidden_rows', 'merges', 'print')
+    assert content_differences(output_of(serial), output_of(pooled),
+                               sections) == {}
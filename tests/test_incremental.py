@@ -0,0 +1,76 @@
+import logging
+import os
+
+import pytest
+
+from act_documents import DOCUMENT_TYPES
+from conftest import content_differences, generate, output_of, read_records
+
+
+def changed_row(records, index=2):
+    '''Записи, в которых у одной строки изменились работы.'''
+    records = list(records)
+    records[index] = records[index]._replace(
+        work_name='Изменённое наименование работ')
+    return records
+
+
+def file_times(folder):
+    return {name: os.stat(os.path.join(folder, name)).st_mtime_ns
+            for name in os.listdir(folder)}
+
+
+def test_unchanged_data_rebuilds_nothing(workdir, caplog):
+    caplog.set_level(logging.INFO)
+    records = read_records(DOCUMENT_TYPES['gi'])
+    document, _ = generate('gi', records, 'out', incremental=True)
+    before = file_times(document.output_folder)
+
+    caplog.clear()
+    generate('gi', records, 'out', incremental=True)
+    assert (f'без изменений {len(before)}, к пересборке 0'
+            in caplog.text)
+    assert file_times(document.output_folder) == before
+
+
+@pytest.mark.parametrize('engine', ['openpyxl', 'xml'])
+def test_changed_row_rebuilds_only_its_file(workdir, caplog, engine):
+    '''Отдельные файлы: перезаписывается только файл изменённого акта.'''
+    caplog.set_level(logging.INFO)
+    records = read_records(DOCUMENT_TYPES['gi'])
+    document, _ = generate('gi', records, 'out', engine=engine,
+                           incremental=True)
+    before = file_times(document.output_folder)
+
+    changed = changed_row(records)
+    caplog.clear()
+    _, outputs = generate('gi', changed, 'out', engine=engine,
+                          incremental=True)
+    assert 'к пересборке 1' in caplog.text
+    rebuilt = os.path.basename(outputs[str(changed[2].id)])
+    after = file_times(document.output_folder)
+    assert [name for name in after if after[name] != before[name]] == [
+        rebuilt]
+
+    expected, _ = generate('gi', changed, 'full', engine=engine)
+    assert content_differences(output_of(expected),
+                               output_of(document)) == {}
+
+
+def test_changed_row_in_combined_file(workdir, caplog):
+    '''Общий файл: неизменённые листы переносятся, итог — как с нуля.'''
+    caplog.set_level(logging.INFO)
+    records = read_records(DOCUMENT_TYPES['beton'])
+    document, _ = generate('beton', records, 'out', engine='xml',
+                           incremental=True)
+
+    changed = changed_row(records)
+    caplog.clear()
+    generate('beton', changed, 'out', engine='xml', incremental=True)
+    assert 'к пересборке 1' in caplog.text
+
+    expected, _ = generate('beton', changed, 'full', engine='xml')
+    # Порядок общих строк зависит от истории сборок, сравнивается содержимое
+    sections = ('cells', 'hidden_rows', 'merges', 'print')
+    assert content_differences(output_of(expected), output_of(document),
+                               sections) == {}
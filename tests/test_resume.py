@@ -0,0 +1,60 @@
+import logging
+import os
+
+import pytest
+
+from act_documents import DOCUMENT_TYPES
+from act_journal import journal_path
+from conftest import generate, output_of, read_records, zip_parts
+
+
+class Interrupted(Exception):
+    '''Имитация падения запуска посреди генерации.'''
+
+
+def interrupted(records, count):
+    '''Записи, чтение которых обрывается после count строк.'''
+    for number, record in enumerate(records):
+        if number == count:
+            raise Interrupted
+        yield record
+
+
+@pytest.mark.parametrize('engine', ['xml', 'stream'])
+def test_resume_after_interrupted_run(workdir, caplog, engine):
+    '''Продолжение по журналу даёт тот же файл, что и запуск без падения.'''
+    caplog.set_level(logging.INFO)
+    records = read_records(DOCUMENT_TYPES['beton'])
+    expected, _ = generate('beton', records, 'full', engine=engine)
+
+    with pytest.raises(Interrupted):
+        generate('beton', interrupted(records, 5), 'resumed', engine=engine)
+    document = DOCUMENT_TYPES['beton']
+    path = os.path.join('resumed', document.output_folder,
+                        document.output_file)
+    assert os.path.exists(journal_path(path))
+    assert not os.path.exists(path)
+
+    caplog.clear()
+    actual, outputs = generate('beton', records, 'resumed', engine=engine,
+                               resume=True)
+    assert 'Продолжение: готово по журналу листов' in caplog.text
+    assert not os.path.exists(journal_path(path))
+    assert list(outputs) == [str(record.id) for record in records
+                             if record.id]
+    assert zip_parts(output_of(actual)) == zip_parts(output_of(expected))
+
+
+def test_resume_with_changed_row_rebuilds_it(workdir, caplog):
+    '''Акт, строка которого изменилась после падения, строится заново.'''
+    caplog.set_level(logging.INFO)
+    records = read_records(DOCUMENT_TYPES['beton'])
+    with pytest.raises(Interrupted):
+        generate('beton', interrupted(records, 5), 'out', engine='xml')
+
+    changed = list(records)
+    changed[0] = changed[0]._replace(work_name='Изменённые работы')
+    expected, _ = generate('beton', changed, 'full', engine='xml')
+    actual, _ = generate('beton', changed, 'out', engine='xml', resume=True)
+    assert 'Продолжение' not in caplog.text
+    assert zip_parts(output_of(actual)) == zip_parts(output_of(expected))